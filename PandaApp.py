@@ -1,5 +1,6 @@
 """ This is a replacement for ShowBase for starting a Panda3D application.
-It opens a window, starts the task, interval, messenge, and event managers,
+It opens a window (or an offscreen buffer, or nothing at all when
+window-type is 'none'), starts the task, interval, messenge, and event managers,
 garbage collector task, and creates a camera and scengraph for 3D and 2D.
 It uses DirectObject like interface, only in snake_case (eg. ignore_all() not ignoreAll())
 
@@ -13,7 +14,7 @@ It will NOT:
 -setup particle system
 -setup physics
 -setup BulletinBoard
--setup Jobs
+-setup Jobs (Panda's JobManager, there's add_job() instead)
 -create render2dp, aspect2dp and any aspect2d children (a2dTop, a2dBottomCenterNs, etc)
 -enforce a singelton pattern (shoot your own foot if you like)
 -walk the dog, put out the trash
@@ -21,6 +22,10 @@ It will NOT:
 
 __all__ = ['PandaApp']
 
+import time
+#how long 'import PandaApp' takes goes into the startup profile
+_import_start = getattr(time, 'perf_counter', time.time)()
+
 from panda3d.core import *
 from panda3d.direct import throw_new_frame
 from panda3d.direct import storeAccessibilityShortcutKeys
@@ -30,33 +35,178 @@ from direct.showbase.EventManagerGlobal import eventMgr
 from direct.showbase.MessengerGlobal import messenger
 from direct.task.TaskManagerGlobal import taskMgr
 from direct.task import Task
-from direct.interval import IntervalManager
-from direct.showbase import Loader
-from direct.showbase import AppRunnerGlobal
 
 from simpleconfig import SimpleConfig as Config
+from framestats import FrameStats, PhaseTimer, clock
+from asyncloader import AsyncLoader
+from shadercache import ShaderCache
+from framepacer import FramePacer
+from windowstate import WindowState
+from taskregistry import TaskRegistry
+from fixedstep import FixedStep
+from renderstages import RenderStageTimer
+from inputstate import InputState
+from assetcache import AssetCache
+from prefetch import AssetManifest
+from shadercache import make_define_key
+from stategc import StateGC
+from gccontrol import GCControl
+from jobscheduler import JobScheduler
+from framecapture import FrameCapture
 
-try:
-    from functools import lru_cache
-except ImportError:
-    from lru_backport import lru_cache
-import time
 import os
+import sys
+import random
+import struct
+import tempfile
+
+_import_time = clock() - _import_start
+
+#Declare config variables that Panda3D doesn't declare itself,
+#so self.config returns typed values with sane defaults
+ConfigVariableString('window-type', 'onscreen',
+    "'onscreen', 'offscreen' or 'none', the last two run PandaApp headless")
+ConfigVariableBool('frame-stats', False,
+    "Record per-frame timings of the core and owned tasks (see framestats.py)")
+ConfigVariableInt('frame-stats-frames', 600,
+    "How many frames of timings frame-stats keeps")
+ConfigVariableString('frame-stats-file', 'frame_stats.json',
+    "Where frame-stats are dumped on exit(), empty to not dump")
+ConfigVariableInt('async-load-threads', 2,
+    "Number of threads (and max concurrent loads) for the load_*_async() functions")
+ConfigVariableInt('async-load-attach-per-frame', 8,
+    "Max async loads reparented/handed over per frame, 0 for no limit")
+ConfigVariableInt('shader-cache-size', 256,
+    "Max number of shader variants load_glsl_shader() keeps, 0 for no limit")
+ConfigVariableString('shader-cache-dir', '',
+    "If set, load_glsl_shader() keeps the preprocessed shader variants there")
+ConfigVariableBool('shader-cache-check-files', True,
+    "Should load_glsl_shader() check if the shader files changed on disk")
+ConfigVariableDouble('fps-foreground', 0,
+    "Frame rate limit when the window has focus, 0 for no limit")
+ConfigVariableDouble('fps-background', 30,
+    "Frame rate limit when the window is not focused, 0 for no limit")
+ConfigVariableDouble('fps-minimized', 10,
+    "Frame rate limit when the window is minimized, 0 for no limit")
+ConfigVariableDouble('frame-pacer-spin', 0.002,
+    "Seconds before the next frame the frame limiter stops sleeping and starts spinning")
+ConfigVariableDouble('window-resize-delay', 0.1,
+    "window-event-resize is sent when the window size didn't change for this many seconds")
+ConfigVariableDouble('fixed-step-rate', 60,
+    "Steps per second for the tasks added with add_fixed_task()")
+ConfigVariableInt('fixed-step-max-steps', 5,
+    "Max fixed steps run in one frame, time above that is dropped")
+ConfigVariableBool('render-stage-timing', False,
+    "Time the cull and draw of the main window display regions (see renderstages.py)")
+ConfigVariableString('render-threading-model', '',
+    "Run cull and draw on their own threads, eg. 'Cull/Draw' or 'Cull', empty leaves Panda's threading-model")
+ConfigVariableFilename('record-session', '',
+    "Record the input (buttons and pointer, per frame) into this file")
+ConfigVariableFilename('playback-session', '',
+    "Play back the input recorded with record-session from this file")
+ConfigVariableBool('playback-exit', True,
+    "Exit when the playback-session is over")
+ConfigVariableBool('input-state', False,
+    "Fill self.input_state with the keyboard and mouse state once per frame")
+ConfigVariableBool('startup-profile', False,
+    "Print how long each step of the PandaApp startup took")
+ConfigVariableDouble('asset-cache-mb', 0,
+    "Memory budget (in MB) of the model and texture cache used by load_model() and load_tex(), 0 turns it off")
+ConfigVariableFilename('prefetch-manifest', '',
+    "Record the assets loaded at startup into this file and load them in the background on the next start")
+ConfigVariableDouble('prefetch-record-time', 10.0,
+    "How many seconds from the start to record into the prefetch-manifest")
+ConfigVariableBool('prefer-baked-assets', True,
+    "Load the .bam/.txo made by 'python -m bake' instead of the source file, if it's up to date")
+ConfigVariableInt('state-gc-threshold', 1000,
+    "With garbage-collect-states, collect once the state caches grew by this many states")
+ConfigVariableDouble('state-gc-budget', 0.5,
+    "Milliseconds per frame the state garbage collection may take")
+ConfigVariableDouble('state-gc-slice', 0.25,
+    "Part of the state caches walked by one garbage collection slice")
+ConfigVariableBool('python-gc-control', False,
+    "Run Python's full garbage collections after rendering, when there's time left in the frame")
+ConfigVariableDouble('python-gc-frame-budget', 16.7,
+    "Frame time (ms) python-gc-control assumes when there's no frame rate limit")
+ConfigVariableDouble('python-gc-max-interval', 10.0,
+    "Seconds after which python-gc-control does a full collection even if there's no time for it")
+ConfigVariableDouble('job-budget', 2.0,
+    "Milliseconds per frame the jobs added with add_job() may take")
+ConfigVariableInt('procgen-processes', 0,
+    "Number of worker processes for generate_geom(), 0 is one per cpu core")
+ConfigVariableInt('procgen-attach-per-frame', 4,
+    "How many generate_geom() results get turned into nodes per frame (0 means no limit)")
+ConfigVariableInt('capture-buffers', 4,
+    "Size of the buffer ring of start_capture(), frames are dropped when all are waiting to be written")
+
+def _get_complete_size(data):
+    """Returns how many bytes at the start of a recorded session (a bam
+    stream of RecorderFrames) hold whole frames, 0 if none. A recording
+    that was not closed ends in the middle of one, and Panda's
+    RecorderController spins forever in play_frame() when it gets there."""
+    data = bytearray(data)
+    if data[:6] != bytearray(b'pbj\x00\n\r'):
+        return 0
+    pos = 6
+    complete = 0
+    while pos + 4 <= len(data):
+        size = struct.unpack_from('<I', data, pos)[0]
+        pos += 4
+        if size == 0xffffffff:
+            if pos + 8 > len(data):
+                break
+            size = struct.unpack_from('<Q', data, pos)[0]
+            pos += 8
+        if size == 0 or pos + size > len(data):
+            break
+        #BOC_pop, the datagram that ends an object
+        if data[pos] == 1:
+            complete = pos + size
+        pos += size
+    return complete
 
 class PandaApp(object):
+    #names of the tasks started by restart()
+    _core_tasks = ('frame_stats', 'reset_prev_transform', 'data_loop', 'window_state',
+                   'fixed_step', 'interval_loop', 'job_scheduler',
+                   'async_loader', 'procgen', 'garbage_collect_states', 'render_frame_loop',
+                   'frame_capture', 'frame_pacer')
+    #attributes made on first use, name: method that makes them
+    _lazy_attributes = {'app_runner': '_setup_app_runner',
+                        'loader': '_setup_loader',
+                        'asset_cache': '_setup_asset_cache',
+                        'lerps': '_setup_lerps',
+                        'procgen': '_setup_procgen',
+                        'render2d': '_setup_2d',
+                        'aspect2d': '_setup_2d',
+                        'pixel2d': '_setup_2d',
+                        'camera2d': '_setup_2d',
+                        'cam2d': '_setup_2d'}
 
     def __init__(self):
-        # This contains the global appRunner instance, as imported from
-        # AppRunnerGlobal.  This will be None if we are not running in the
-        # runtime environment (ie. from a .p3d file).
-        self.app_runner = AppRunnerGlobal.appRunner
+        # Times each step of the startup, see get_startup_profile()
+        self.startup_timer = PhaseTimer()
+        self.startup_timer.phases.append(('import', _import_time))
 
         #store the Config class, it's nice, use it
         self.config=Config
 
-        #Set the default loader... for some reason
         self.graphics_engine = GraphicsEngine.get_global_ptr()
-        self.loader = Loader.Loader(self)
+        # The threading model of the pipeline has to be set before the window opens.
+        # No sync points are needed for it: render_frame() cycles the pipeline, so cull
+        # and draw work on their own copy of the scene graph from the last frame and
+        # whatever the tasks change goes into the next one. reset_prev_transform and
+        # the state cache collection are done on cycled data / under the cache locks,
+        # they stay ordinary tasks.
+        if Config['render-threading-model']:
+            self.graphics_engine.set_threading_model(GraphicsThreadingModel(Config['render-threading-model']))
+        self.render_stage_timer = None
+        if Config['render-stage-timing']:
+            self.render_stage_timer = RenderStageTimer()
+        self.startup_timer.mark('graphics_engine')
+        self.shader_cache = ShaderCache(Config['shader-cache-size'],
+                                        Config['shader-cache-dir'],
+                                        Config['shader-cache-check-files'])
 
         # This is the DataGraph traverser, which we might as well
         # create now.
@@ -69,21 +219,13 @@ class PandaApp(object):
             storeAccessibilityShortcutKeys()
             allowAccessibilityShortcutKeys(False)
 
-        #Make render, render2d and pixel2d nodes
+        #Make render, render2d, aspect2d and pixel2d get made on first use
         self.render = NodePath('render')
-        self.render2d = NodePath('render2d')
-        self.render2d.set_depth_test(0)
-        self.render2d.set_depth_write(0)
-        self.render2d.set_material_off(1)
-        self.render2d.set_two_sided(1)
-        self.aspect2d = self.render2d.attach_new_node(PGTop("aspect2d"))
-        aspectRatio = self.get_aspect_ratio()
-        self.aspect2d.set_scale(1.0 / aspectRatio, 1.0, 1.0)
-        self.pixel2d = self.render2d.attach_new_node(PGTop("pixel2d"))
-        self.pixel2d.set_pos(-1, 0, 1)
-        xsize, ysize = self.get_size()
-        if xsize > 0 and ysize > 0:
-            self.pixel2d.set_scale(2.0 / xsize, 1.0, 2.0 / ysize)
+        self.startup_timer.mark('scene_graph')
+
+        #Record or play back the input, if asked to
+        self._setup_recorder()
+        self.startup_timer.mark('recorder')
 
         #Open default window
         self._open_main_window()
@@ -94,6 +236,13 @@ class PandaApp(object):
         self.messenger = messenger
         # The global task manager, as imported from TaskManagerGlobal.
         self.task_mgr = taskMgr
+        # Index of the tasks owned by the app (added with add_task/do_method_later)
+        self.task_registry = TaskRegistry(self.task_mgr)
+        self._taskList = self.task_registry.tasks
+        # Runs the tasks added with add_fixed_task() at a fixed rate
+        self.fixed_step = FixedStep(Config['fixed-step-rate'], Config['fixed-step-max-steps'])
+        self._ival_mgr = None
+        self.startup_timer.mark('managers')
 
         # Get a pointer to Panda's global ClockObject, used for
         # synchronizing events between Python and C.
@@ -105,15 +254,201 @@ class PandaApp(object):
 
         #Make the TaskManager start using the new globalClock.
         self.task_mgr.globalClock = self.global_clock
+        self.startup_timer.mark('clock')
+
+        #Per-frame task timings, None unless frame-stats is on
+        self.frame_stats = None
+        if Config['frame-stats']:
+            self.frame_stats = FrameStats(Config['frame-stats-frames'])
+
+        #Collects the unused Render/TransformStates when there are enough of them
+        self.state_gc = None
+        if Config['garbage-collect-states']:
+            self.state_gc = StateGC(Config['state-gc-threshold'], Config['state-gc-budget'],
+                                    Config['state-gc-slice'], self.frame_stats)
+
+        #Runs the generator jobs added with add_job() a slice per frame (see jobscheduler.py)
+        self.job_scheduler = JobScheduler(Config['job-budget'], self.frame_stats)
+
+        #Loads assets on a threaded task chain for the load_*_async() functions
+        self.async_loader = AsyncLoader(self.task_mgr, Config['async-load-threads'],
+                                        Config['async-load-attach-per-frame'])
+
+        #The running start_capture() captures (see framecapture.py)
+        self.frame_captures = []
+
+        #Limits the frame rate, depending on focus (see framepacer.py)
+        self.frame_pacer = FramePacer(Config['fps-foreground'], Config['fps-background'],
+                                      Config['fps-minimized'], Config['frame-pacer-spin'])
+        self._update_frame_pacer()
+
+        #Keeps Python's full garbage collections out of the frame (see gccontrol.py)
+        self.gc_control = None
+        if Config['python-gc-control']:
+            self.gc_control = GCControl(Config['python-gc-frame-budget'] / 1000.0,
+                                        Config['python-gc-max-interval'], self.frame_stats)
+            self.gc_control.enable()
+
+        #Loads the assets used at the last start in the background (see prefetch.py)
+        self.asset_manifest = None
+        if not Config['prefetch-manifest'].empty():
+            self.asset_manifest = AssetManifest(Config['prefetch-manifest'].to_os_specific(),
+                                                Config['prefetch-record-time'])
+            self.asset_manifest.prefetch(self._load_async, {'model': self.load_model,
+                                                            'tex': self.load_tex,
+                                                            'shader': self.load_glsl_shader})
+            self.task_mgr.doMethodLater(Config['prefetch-record-time'], self.asset_manifest.save,
+                                        'save_asset_manifest')
+
+        #Array backed keyboard/mouse state, filled in data_loop (see inputstate.py)
+        self.input_state = None
+        if Config['input-state']:
+            self.input_state = InputState(self.messenger, self.button_throwers,
+                                          self.pointer_watcher_nodes)
 
         #Listen for window shape, size and focus change events
         self.accept('window-event', self._on_window_event)
+        self.startup_timer.mark('subsystems')
 
         # Start render_frame_loop
         self.restart()
+        self.startup_timer.mark('restart')
+        if Config['startup-profile']:
+            print(self.startup_timer.format_report())
+
+    def __getattr__(self, name):
+        """Makes the _lazy_attributes on first use"""
+        setup = PandaApp._lazy_attributes.get(name)
+        if setup is None:
+            raise AttributeError("'{0}' object has no attribute '{1}'".format(
+                                 type(self).__name__, name))
+        getattr(self, setup)()
+        return self.__dict__[name]
+
+    def get_startup_profile(self):
+        """Returns a list of (startup step, ms)"""
+        return self.startup_timer.get_report()
+
+    def _setup_app_runner(self):
+        # This contains the global appRunner instance, as imported from
+        # AppRunnerGlobal.  This will be None if we are not running in the
+        # runtime environment (ie. from a .p3d file).
+        from direct.showbase import AppRunnerGlobal
+        self.app_runner = AppRunnerGlobal.appRunner
+
+    def _setup_loader(self):
+        #Set the default loader... for some reason
+        from direct.showbase import Loader
+        self.loader = Loader.Loader(self)
+
+    def _setup_asset_cache(self):
+        #None unless asset-cache-mb is set, see assetcache.py
+        self.asset_cache = None
+        if Config['asset-cache-mb'] > 0:
+            self.asset_cache = AssetCache(self.loader, int(Config['asset-cache-mb'] * 1024 * 1024))
+
+    def _setup_lerps(self):
+        # Lerps added with lerp(), stepped in bulk next to the intervals
+        # (batchlerp imports numpy, so not before the first lerp)
+        from batchlerp import LerpBatch
+        self.lerps = LerpBatch(self.global_clock.get_frame_time)
+
+    def _setup_procgen(self):
+        #Makes geometry on a process pool for generate_geom() (see procgen.py)
+        from procgen import ProcGen
+        self.procgen = ProcGen(Config['procgen-processes'], Config['procgen-attach-per-frame'])
+
+    def _setup_2d(self):
+        """Makes render2d, aspect2d, pixel2d and the 2d camera,
+        with a display_region for it if there is a window"""
+        self.render2d = NodePath('render2d')
+        self.render2d.set_depth_test(0)
+        self.render2d.set_depth_write(0)
+        self.render2d.set_material_off(1)
+        self.render2d.set_two_sided(1)
+        self.aspect2d = self.render2d.attach_new_node(PGTop("aspect2d"))
+        self.pixel2d = self.render2d.attach_new_node(PGTop("pixel2d"))
+        self.pixel2d.set_pos(-1, 0, 1)
+        xsize, ysize = self.get_size()
+        if xsize > 0 and ysize > 0:
+            self.pixel2d.set_scale(2.0 / xsize, 1.0, 2.0 / ysize)
+        self._adjust_window_aspect_ratio(self.get_aspect_ratio())
+
+        # make a 2d camera
+        cam_2d_node = Camera('cam2d')
+        lens = OrthographicLens()
+        left, right, bottom, top = (-1, 1, -1, 1)
+        lens.set_film_size(right - left, top - bottom)
+        lens.set_film_offset((right + left) * 0.5, (top + bottom) * 0.5)
+        lens.set_near_far(-1000, 1000)
+        cam_2d_node.set_lens(lens)
+        self.camera2d = self.render2d.attach_new_node('camera2d')
+        self.cam2d = self.camera2d.attach_new_node(cam_2d_node)
+
+        if self.win is not None:
+            #make a display_region for 2d
+            dr = self.win.make_mono_display_region(*(0, 1, 0, 1))
+            dr.set_sort(10)
+            dr.set_clear_depth_active(1)
+            # Make any texture reloads on the gui come up immediately.
+            dr.set_incomplete_render(False)
+            dr.set_camera(self.cam2d)
+            if self.render_stage_timer:
+                self.render_stage_timer.attach(dr)
+
+        # Tell the gui system about our mouse watcher.
+        self.aspect2d.node().set_mouse_watcher(self.mouse_watcher_node)
+        self.pixel2d.node().set_mouse_watcher(self.mouse_watcher_node)
+
+    def _setup_recorder(self):
+        """Makes a RecorderController if there is a record-session or
+        playback-session in the config. Each input device gets a
+        MouseRecorder in its data graph chain, when playing back it feeds
+        the recorded buttons and pointer to the MouseWatcher, so a session
+        recorded in a window can be played back headless."""
+        self.recorder = None
+        self.playing_back = False
+        self._session_copy = None
+        if not Config['playback-session'].empty():
+            session = self._get_playable_session(Config['playback-session'])
+            if session is not None:
+                self.recorder = RecorderController()
+                self.recorder.begin_playback(session)
+                self.playing_back = self.recorder.is_playing()
+        elif not Config['record-session'].empty():
+            self.recorder = RecorderController()
+            self.recorder.begin_record(Config['record-session'])
+        if self.recorder:
+            # If we're either playing back or recording, pass the
+            # random seed into the system so each session will have
+            # the same random seed.
+            random.seed(self.recorder.get_random_seed())
+
+    def _get_playable_session(self, session):
+        """Returns the session file to play back, for a session that was
+        cut short (eg. killed while recording) that's a temporary copy of
+        the whole frames in it, so the playback stops at its end.
+        None if there's nothing to play back."""
+        path = session.to_os_specific()
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            #begin_playback() reports it
+            return session
+        size = _get_complete_size(data)
+        if size == len(data):
+            return session
+        print('Session {0} is cut short, playing back {1} of {2} bytes'.format(path, size, len(data)))
+        if not size:
+            return None
+        fd, self._session_copy = tempfile.mkstemp(suffix='.bin')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data[:size])
+        return Filename.from_os_specific(self._session_copy)
 
     def _get_win_props(self):
-        if getattr(self, 'win', None):
+        if isinstance(getattr(self, 'win', None), GraphicsWindow):
             props=self.win.get_requested_properties()
             if props.has_size(): #no size? probably not what we want.
                 return props
@@ -121,109 +456,169 @@ class PandaApp(object):
                 props=self.win.get_properties()
             if props.has_size():
                 return props
+        elif getattr(self, 'win', None):
+            #offscreen buffers have no WindowProperties, only a size
+            props = WindowProperties()
+            props.set_size(self.win.get_x_size(), self.win.get_y_size())
+            return props
         return WindowProperties.get_default()
 
     def _open_main_window(self):
         """
         Creates the initial, main window for the application, and sets
         up the mouse and render2d structures appropriately for it.
+
+        What gets opened depends on the 'window-type' config:
+        'onscreen' - a normal window (the default)
+        'offscreen' - an offscreen buffer of 'win-size', the software renderer
+                      (p3tinydisplay) is used if the default pipe can't make one
+        'none' - no pipe and no output at all, render2d, aspect2d and pixel2d
+                 use 'win-size' as a virtual size
+        Without a window the input comes from a VirtualMouse (self.virtual_mouse).
+        Returns True if a window or buffer was opened.
         """
+        self.window_type = Config['window-type']
+        self.headless = self.window_type != 'onscreen'
+        self.win = None
+        if self.window_type != 'none':
+            self.win = self._make_main_output()
+            if self.win is None and self.headless:
+                print('Unable to open an offscreen buffer, using window-type none')
+                self.window_type = 'none'
+        #there's nothing to minimize or unfocus when running headless
+        self.minimized = False
+        self.focus = self.headless
+        self.window_state = WindowState(self.get_size(), self.focus, self.minimized,
+                                        Config['window-resize-delay'])
+        self._window_changed = False
+
+        self.startup_timer.mark('main_output')
+
+        self._make_camera()
+        if self.win is not None:
+            self._make_display_region()
+        self.startup_timer.mark('camera')
+        self._setup_inputs()
+        self.startup_timer.mark('inputs')
+
+        self.set_frame_rate_meter(Config['show-frame-rate-meter'])
+        self.startup_timer.mark('frame_rate_meter')
+        return self.win is not None
+
+    def _make_main_output(self):
+        """Opens the main window or (if running headless) an offscreen buffer.
+        Returns None if nothing could be opened."""
+        selection = GraphicsPipeSelection.get_global_ptr()
         if not getattr(self, 'pipe', None):
-            self.pipe = GraphicsPipeSelection.get_global_ptr().make_default_pipe()
+            self.pipe = selection.make_default_pipe()
 
-        # Open a new window.
-        flags = GraphicsPipe.BF_require_window | GraphicsPipe.BF_fb_props_optional
         fbprops = FrameBufferProperties.get_default()
         props = WindowProperties.get_default()
         props = WindowProperties(props)
         props.set_size(*Config['win-size'])
-
-        self.win = self.graphics_engine.make_output(self.pipe, 'main_window', 0,
-                                                    fbprops, props, flags)
-
-        if self.win != None:
-            self.minimized=False
-            self.focus=False
-            self.last_win_size=self.get_size()
-            #make a display_region for 2d
-            dr = self.win.make_mono_display_region(*(0, 1, 0, 1))
-            dr.set_sort(10)
-            dr.set_clear_depth_active(1)
-            # Make any texture reloads on the gui come up immediately.
-            dr.set_incomplete_render(False)
-
-            # make a 2d camera
-            cam_2d_node = Camera('cam2d')
-            lens = OrthographicLens()
-            left, right, bottom, top = (-1, 1, -1, 1)
-            lens.set_film_size(right - left, top - bottom)
-            lens.set_film_offset((right + left) * 0.5, (top + bottom) * 0.5)
-            lens.set_near_far(-1000, 1000)
-            cam_2d_node.set_lens(lens)
-            self.camera2d = self.render2d.attach_new_node('camera2d')
-            camera2d = self.camera2d.attach_new_node(cam_2d_node)
-            dr.set_camera(camera2d)
-            self.cam2d = camera2d
-
-            #make the default camera and display_region
-            self.camera = self.render.attach_new_node(ModelNode('camera'))
-            self.camera.node().set_preserve_transform(ModelNode.PTLocal)
-            # Make a  Camera node.
-            cam_node = Camera('cam')
-            self.lens = PerspectiveLens()
-            self.lens.set_aspect_ratio(self.get_aspect_ratio())
-            cam_node.set_lens(self.lens)
-            self.cam = self.camera.attach_new_node(cam_node)
-            dr = self.win.make_display_region(*(0, 1, 0, 1))
-            dr.set_sort(0)
-            dr.set_camera(self.cam)
-
-            #setup mouse and keyboard inputs
-            self.button_throwers = []
-            self.pointer_watcher_nodes = []
+        if self.headless:
+            flags = GraphicsPipe.BF_refuse_window | GraphicsPipe.BF_fb_props_optional
+        else:
+            flags = GraphicsPipe.BF_require_window | GraphicsPipe.BF_fb_props_optional
+
+        win = None
+        if self.pipe:
+            win = self.graphics_engine.make_output(self.pipe, 'main_window', 0,
+                                                   fbprops, props, flags)
+        if win is None and self.headless:
+            #no display or no gpu? try the software renderer
+            pipe = selection.make_module_pipe('p3tinydisplay')
+            if pipe:
+                win = self.graphics_engine.make_output(pipe, 'main_window', 0,
+                                                       fbprops, props, flags)
+                if win is not None:
+                    self.pipe = pipe
+        return win
+
+    def _make_camera(self):
+        """Makes the 3d camera, it exists even if there is no window
+        (the 2d camera is made with render2d, on first use)"""
+        #make the default camera
+        self.camera = self.render.attach_new_node(ModelNode('camera'))
+        self.camera.node().set_preserve_transform(ModelNode.PTLocal)
+        # Make a  Camera node.
+        cam_node = Camera('cam')
+        self.lens = PerspectiveLens()
+        self.lens.set_aspect_ratio(self.get_aspect_ratio())
+        cam_node.set_lens(self.lens)
+        self.cam = self.camera.attach_new_node(cam_node)
+
+    def _make_display_region(self):
+        """Makes the 3d display_region on the main window"""
+        #make the default display_region
+        dr = self.win.make_display_region(*(0, 1, 0, 1))
+        dr.set_sort(0)
+        dr.set_camera(self.cam)
+        if self.render_stage_timer:
+            self.render_stage_timer.attach(dr)
+
+    def _setup_inputs(self):
+        """Sets up a MouseWatcher and ButtonThrower for each input device
+        of the main window. If there is no window (or it has no input devices)
+        a VirtualMouse is used instead, so mouse_watcher_node and get_mouse()
+        still work (the mouse is 'outside' until self.virtual_mouse says otherwise)."""
+        self.button_throwers = []
+        self.pointer_watcher_nodes = []
+        self.virtual_mouse = None
+        if isinstance(self.win, GraphicsWindow):
             for i in range(self.win.get_num_input_devices()):
                 name = self.win.get_input_device_name(i)
                 mk = self.data_root.attach_new_node(MouseAndKeyboard(self.win, i, name))
-                mw = mk.attach_new_node(MouseWatcher("watcher%s" % (i)))
-
-                if self.win.get_side_by_side_stereo():
-                    # If the window has side-by-side stereo enabled, then
-                    # we should constrain the MouseWatcher to the window's
-                    # DisplayRegion.  This will enable the MouseWatcher to
-                    # track the left and right halves of the screen
-                    # individually.
-                    mw.node().set_display_region(self.win.get_overlay_display_region())
-
-                mb = mw.node().get_modifier_buttons()
-                mb.add_button(KeyboardButton.shift())
-                mb.add_button(KeyboardButton.control())
-                mb.add_button(KeyboardButton.alt())
-                mb.add_button(KeyboardButton.meta())
-                mw.node().set_modifier_buttons(mb)
-                bt = mw.attach_new_node(ButtonThrower("buttons%s" % (i)))
-                if (i != 0):
-                    bt.node().set_prefix('mousedev%s-' % (i))
-                mods = ModifierButtons()
-                mods.add_button(KeyboardButton.shift())
-                mods.add_button(KeyboardButton.control())
-                mods.add_button(KeyboardButton.alt())
-                mods.add_button(KeyboardButton.meta())
-                bt.node().set_modifier_buttons(mods)
-                self.button_throwers.append(bt)
-                if (self.win.has_pointer(i)):
-                    self.pointer_watcher_nodes.append(mw.node())
-
-            self.mouse_watcher = self.button_throwers[0].get_parent()
-            self.mouse_watcher_node = self.mouse_watcher.node()
-
-            # Tell the gui system about our new mouse watcher.
-            self.aspect2d.node().set_mouse_watcher(self.mouse_watcher_node)
-            self.pixel2d.node().set_mouse_watcher(self.mouse_watcher_node)
-            self.mouse_watcher_node.add_region(PGMouseWatcherBackground())
-
-            self.set_frame_rate_meter(Config['show-frame-rate-meter'])
-            return True
-        return False
+                self._add_input_chain(mk, i, self.win.has_pointer(i))
+        if not self.button_throwers:
+            self.virtual_mouse = VirtualMouse('virtual_mouse')
+            self.virtual_mouse.set_window_size(*self.get_size())
+            vm = self.data_root.attach_new_node(self.virtual_mouse)
+            self._add_input_chain(vm, 0, True)
+
+        self.mouse_watcher = self.button_throwers[0].get_parent()
+        self.mouse_watcher_node = self.mouse_watcher.node()
+
+        # The gui system gets told about the mouse watcher when render2d is made
+        self.mouse_watcher_node.add_region(PGMouseWatcherBackground())
+
+    def _add_input_chain(self, input_np, i, has_pointer):
+        """Attaches a MouseWatcher and a ButtonThrower under the input_np data node"""
+        if self.recorder:
+            # If we have a recorder, the mouseWatcher belongs under a
+            # special MouseRecorder node, which may intercept the
+            # mouse activity.
+            mouse_recorder = MouseRecorder('mouse%s' % (i))
+            self.recorder.add_recorder('mouse%s' % (i), mouse_recorder)
+            input_np = input_np.attach_new_node(mouse_recorder)
+        mw = input_np.attach_new_node(MouseWatcher("watcher%s" % (i)))
+
+        if self.win is not None and self.win.get_side_by_side_stereo():
+            # If the window has side-by-side stereo enabled, then
+            # we should constrain the MouseWatcher to the window's
+            # DisplayRegion.  This will enable the MouseWatcher to
+            # track the left and right halves of the screen
+            # individually.
+            mw.node().set_display_region(self.win.get_overlay_display_region())
+
+        mb = mw.node().get_modifier_buttons()
+        mb.add_button(KeyboardButton.shift())
+        mb.add_button(KeyboardButton.control())
+        mb.add_button(KeyboardButton.alt())
+        mb.add_button(KeyboardButton.meta())
+        mw.node().set_modifier_buttons(mb)
+        bt = mw.attach_new_node(ButtonThrower("buttons%s" % (i)))
+        if (i != 0):
+            bt.node().set_prefix('mousedev%s-' % (i))
+        mods = ModifierButtons()
+        mods.add_button(KeyboardButton.shift())
+        mods.add_button(KeyboardButton.control())
+        mods.add_button(KeyboardButton.alt())
+        mods.add_button(KeyboardButton.meta())
+        bt.node().set_modifier_buttons(mods)
+        self.button_throwers.append(bt)
+        if has_pointer:
+            self.pointer_watcher_nodes.append(mw.node())
 
     def __reset_prev_transform(self, state):
         """Clear out the previous velocity deltas now, after we have
@@ -235,9 +630,29 @@ class PandaApp(object):
         PandaNode.reset_all_prev_transform()
         return Task.cont
 
+    def __fixed_step(self, state):
+        """Runs the fixed steps for this frame"""
+        if self.fixed_step._callbacks:
+            self.fixed_step.update(self.global_clock.get_dt())
+        return Task.cont
+
     def __interval_loop(self, state):
-        """Execute all intervals in the global ivalMgr."""
-        IntervalManager.ivalMgr.step()
+        """Steps the batched lerps and executes all intervals in the global ivalMgr.
+        Nothing to do for the ivalMgr until something imports the IntervalManager,
+        there can't be any intervals before that, or lerps before lerp()."""
+        if 'lerps' in self.__dict__:
+            self.lerps.step()
+        if self._ival_mgr is None:
+            module = sys.modules.get('direct.interval.IntervalManager')
+            if module is None:
+                return Task.cont
+            self._ival_mgr = module.ivalMgr
+        self._ival_mgr.step()
+        return Task.cont
+
+    def __procgen(self, state):
+        if 'procgen' in self.__dict__:
+            self.procgen.update()
         return Task.cont
 
     def __garbage_collect_states(self, state):
@@ -245,36 +660,80 @@ class PandaApp(object):
         garbage-collect-states set in the Config.prc file, in which
         case we're responsible for taking out Panda's garbage from
         time to time.  This is not to be confused with Python's
-        garbage collection.  """
-        TransformState.garbage_collect()
-        RenderState.garbage_collect()
+        garbage collection. See stategc.py for when it collects. """
+        self.state_gc.update()
+        return Task.cont
+
+    def __frame_capture(self, state):
+        if self.frame_captures:
+            for capture in self.frame_captures:
+                capture.update()
+            self.frame_captures = [capture for capture in self.frame_captures
+                                   if capture.is_capturing()]
         return Task.cont
 
     def __render_frame_loop(self, state):
+        if self.recorder:
+            self.recorder.record_frame()
+
         # Render the frame.
-        self.graphics_engine.render_frame()
+        if self.render_stage_timer:
+            start = clock()
+            self.graphics_engine.render_frame()
+            self.render_stage_timer.add('app_render_frame', clock() - start)
+        else:
+            self.graphics_engine.render_frame()
+
+        if self.recorder:
+            self.recorder.play_frame()
+            if self.playing_back and not self.recorder.is_playing():
+                self.playing_back = False
+                self.send('playback-done')
+                if Config['playback-exit']:
+                    self.exit()
 
-        if self.minimized:
-            # If the main window is minimized, slow down the app a bit
-            # by sleeping here in igLoop so we don't use all available
-            # CPU needlessly.
-            time.sleep(0.1)
         # Lerp stuff needs this event, and it must be generated in
         # C++, not in Python.
         throw_new_frame()
         return Task.cont
 
+    def __frame_pacer(self, state):
+        """Waits for the next frame if there's a frame rate limit,
+        (by default there is one when the window is minimized or not focused)
+        so we don't use all available CPU needlessly.
+        The Python gc gets to use the time that's left first."""
+        if self.gc_control:
+            self.gc_control.idle(self.frame_pacer.get_time_left(self.gc_control.frame_budget))
+        self.frame_pacer.wait()
+        return Task.cont
+
+    def __frame_stats(self, state):
+        """Starts a new frame for the frame_stats"""
+        self.frame_stats.begin_frame()
+        return Task.cont
+
     def __data_loop(self, state):
         """Traverse the data graph.  This reads all the control
         inputs (from the mouse and keyboard, for instance) """
+        if self.input_state:
+            self.input_state.begin_frame()
         self.data_graph_trav.traverse(self.data_root_node)
+        if self.input_state:
+            # send out the button events now, so they are in this frame's input_state
+            self.event_mgr.doEvents()
+            self.input_state.update_pointers()
+        # drop cached config values if a prc page got (un)loaded
+        Config.sync()
         return Task.cont
 
     def _adjust_window_aspect_ratio(self, aspectRatio):
-        if getattr(self, 'win', None):
-            self.pixel2d.set_scale(2.0 / self.win.get_sbs_left_x_size(), 1.0, 2.0 / self.win.get_sbs_left_y_size())
         if getattr(self, 'lens', None):
             self.lens.set_aspect_ratio(aspectRatio)
+        if 'render2d' not in self.__dict__:
+            #no 2d yet, it'll get the right ratio when made
+            return
+        if getattr(self, 'win', None):
+            self.pixel2d.set_scale(2.0 / self.win.get_sbs_left_x_size(), 1.0, 2.0 / self.win.get_sbs_left_y_size())
         if aspectRatio < 1:
             # If the window is TALL, lets expand the top and bottom
             self.aspect2d.set_scale(1.0, aspectRatio, aspectRatio)
@@ -283,51 +742,54 @@ class PandaApp(object):
             self.aspect2d.set_scale(1.0 / aspectRatio, 1.0, 1.0)
 
     def _on_window_event(self, win):
-        #fire the event only for our window
+        #only for our window, the properties are read in __window_state
         if getattr(self, 'win', None):
             if win != self.win:
                 return
-        #fire the event only once per frame
-        if not getattr(self, 'last_event_frame', None):
-            self.last_event_frame=0
-        if self.last_event_frame == self.global_clock.get_frame_count():
-            return
-        self.last_event_frame=self.global_clock.get_frame_count()
-
-        properties = win.get_properties()
-        #window resize
-        size=tuple(properties.get_size())
-        if size != self.last_win_size:
+            self._window_changed = True
+
+    def __window_state(self, state):
+        """Snapshots the window properties (once per frame, only if
+        something changed) and sends the window-event-* events for
+        the changes, see windowstate.py"""
+        if not self._window_changed and not self.window_state.is_resize_pending():
+            return Task.cont
+        properties = None
+        if self._window_changed:
+            self._window_changed = False
+            properties = self.win.get_properties()
+        old_size = self.window_state.size
+        events = self.window_state.update(properties, self.global_clock.get_real_time())
+        #keep the aspect ratio right while resizing, the event is sent when it's over
+        if self.window_state.size != old_size:
             self._adjust_window_aspect_ratio(self.get_aspect_ratio())
-            self.last_win_size=tuple(size)
-            self.send('window-event-resize')
-        #window is closed
-        if not properties.get_open():
-            self.send('window-event-close')
-            self.exit()
-        #window focused
-        if properties.get_foreground():
-            if not self.focus:
-                self.focus=True
-                self.send('window-event-focus')
+        self.focus = self.window_state.foreground
+        self.minimized = self.window_state.minimized
+        for event, args in events:
+            if event in ('window-event-focus', 'window-event-focus-lost',
+                         'window-event-minimize', 'window-event-restore'):
+                self._update_frame_pacer()
+            self.send(event, args)
+            #window is closed
+            if event == 'window-event-close':
+                self.exit()
+        return Task.cont
+
+    def _update_frame_pacer(self):
+        """Picks the frame rate limit for the current focus/minimized state"""
+        if self.minimized:
+            self.frame_pacer.set_mode(FramePacer.MINIMIZED)
+        elif self.focus:
+            self.frame_pacer.set_mode(FramePacer.FOREGROUND)
         else:
-            self.focus=False
-            self.send('window-event-focus-lost')
-        #window is (un-)minimized
-        if properties.get_minimized():
-            if not self.minimized:
-                self.minimized=True
-                self.send('window-event-minimize')
-        elif self.minimized:
-            self.minimized=False
-            self.send('window-event-restore')
+            self.frame_pacer.set_mode(FramePacer.BACKGROUND)
 
     def set_frame_rate_meter(self, flag):
         """
         Turns on or off (according to flag) a standard frame rate
         meter in the upper-right corner of the main window.
         """
-        if flag:
+        if flag and getattr(self, 'win', None):
             if not getattr(self, 'frame_rate_meter', None):
                 self.frame_rate_meter = FrameRateMeter('frameRateMeter')
                 self.frame_rate_meter.setup_window(self.win)
@@ -338,31 +800,95 @@ class PandaApp(object):
 
     def exit(self):
         self.send('exit')
+        if self.frame_stats and Config['frame-stats-file']:
+            self.frame_stats.dump(Config['frame-stats-file'])
+        if self.asset_manifest:
+            self.asset_manifest.save()
         self.destroy()
         os._exit(1)
 
     def restart(self):
-        self.task_mgr.remove('render_frame_loop')
-        self.task_mgr.remove('reset_prev_transform')
-        self.task_mgr.remove('interval_loop')
-        self.task_mgr.remove('data_loop')
-        self.task_mgr.remove('garbage_collect_states')
+        for name in self._core_tasks:
+            self.task_mgr.remove(name)
         self.event_mgr.restart()
+        timed = self._timed
+        # frame_stats needs to know when a frame starts, before anything else
+        if self.frame_stats:
+            self.task_mgr.add(self.__frame_stats, 'frame_stats', sort = -52)
         # __resetPrevTransform goes at the very beginning of the frame.
-        self.task_mgr.add(
-            self.__reset_prev_transform, 'reset_prev_transform', sort = -51)
+        self.task_mgr.add(timed(self.__reset_prev_transform, 'reset_prev_transform'),
+                          'reset_prev_transform', sort = -51)
         # give the dataLoop task a reasonably "early" sort,
         # so that it will get run before most tasks
-        self.task_mgr.add(self.__data_loop, 'data_loop', sort = -50)
+        self.task_mgr.add(timed(self.__data_loop, 'data_loop'), 'data_loop', sort = -50)
+        # window-event-* go right after the inputs
+        self.task_mgr.add(timed(self.__window_state, 'window_state'), 'window_state', sort = -49)
+        # the fixed step simulation sees this frame's input, and runs before
+        # the normal tasks, so they can use the new state (and fixed_step.alpha)
+        self.task_mgr.add(timed(self.__fixed_step, 'fixed_step'), 'fixed_step', sort = -45)
         # spawn the ivalLoop with a later sort, so that it will
         # run after most tasks, but before igLoop.
-        self.task_mgr.add(self.__interval_loop, 'interval_loop', sort = 20)
-
-        if Config['garbage-collect-states']:
-            self.task_mgr.add(self.__garbage_collect_states, 'garbage_collect_states', sort = 46)
+        self.task_mgr.add(timed(self.__interval_loop, 'interval_loop'), 'interval_loop', sort = 20)
+        # jobs get what's left of the frame after the tasks and intervals
+        self.task_mgr.add(timed(self.job_scheduler.update, 'job_scheduler'), 'job_scheduler', sort = 40)
+        # finished async loads get reparented after the intervals moved things,
+        # but before the frame is rendered
+        self.task_mgr.add(timed(self.async_loader.update, 'async_loader'), 'async_loader', sort = 44)
+        # same for the geometry made on the process pool
+        self.task_mgr.add(timed(self.__procgen, 'procgen'), 'procgen', sort = 45)
+
+        if self.state_gc:
+            self.task_mgr.add(timed(self.__garbage_collect_states, 'garbage_collect_states'),
+                              'garbage_collect_states', sort = 46)
         # give the igLoop task a reasonably "late" sort,
         # so that it will get run after most tasks
-        self.task_mgr.add(self.__render_frame_loop, 'render_frame_loop', sort = 50)
+        self.task_mgr.add(timed(self.__render_frame_loop, 'render_frame_loop'),
+                          'render_frame_loop', sort = 50)
+        # the frame just rendered goes to the capture writer threads
+        self.task_mgr.add(timed(self.__frame_capture, 'frame_capture'), 'frame_capture', sort = 51)
+        # the wait for the next frame goes last, so it's not counted as rendering
+        self.task_mgr.add(timed(self.__frame_pacer, 'frame_pacer'), 'frame_pacer', sort = 52)
+
+    def _timed(self, func, name):
+        """Returns func wrapped to be timed by frame_stats,
+        or just func if frame-stats is off (or func is not a function)"""
+        if self.frame_stats is None or not callable(func) or isinstance(func, AsyncTask):
+            return func
+        return self.frame_stats.wrap(func, name)
+
+    def _wrap_task_args(self, func_index, args, kwargs, group=None):
+        """Replaces the funcOrTask in the args for task_mgr.add()/doMethodLater()
+        with a version timed for the frame_stats and the task group,
+        the name argument (if any) follows funcOrTask"""
+        if self.frame_stats is None and group is None:
+            return args, kwargs
+        args = list(args)
+        if len(args) > func_index:
+            func = args[func_index]
+        else:
+            func = kwargs['funcOrTask']
+        if len(args) > func_index + 1:
+            name = args[func_index + 1]
+        else:
+            name = kwargs.get('name')
+        if name is None:
+            name = getattr(func, '__name__', 'task')
+        func = self._timed(func, name)
+        if group is not None and callable(func) and not isinstance(func, AsyncTask):
+            func = self.task_registry.wrap(func, group)
+        if len(args) > func_index:
+            args[func_index] = func
+        else:
+            kwargs['funcOrTask'] = func
+        return args, kwargs
+
+    def get_render_stage_stats(self):
+        """Returns the cull/draw times of the display regions (and on what thread
+        they ran) plus the time the app thread spent in render_frame(),
+        needs render-stage-timing set in the config"""
+        if self.render_stage_timer:
+            return self.render_stage_timer.get_stats()
+        return {}
 
     def get_size(self):
         """Returns the actual size of the indicated (or main
@@ -397,14 +923,30 @@ class PandaApp(object):
             allowAccessibilityShortcutKeys(True)
 
         self.ignore_all()
-        self.task_mgr.remove('render_frame_loop')
-        self.task_mgr.remove('reset_prev_transform')
-        self.task_mgr.remove('interval_loop')
-        self.task_mgr.remove('data_loop')
-        self.task_mgr.remove('garbage_collect_states')
+        for name in self._core_tasks:
+            self.task_mgr.remove(name)
         self.event_mgr.shutdown()
-
-        if getattr(self, 'loader', None):
+        self.async_loader.cancel_all()
+        self.job_scheduler.cancel_all()
+        if 'procgen' in self.__dict__:
+            self.procgen.shutdown()
+        for capture in self.frame_captures:
+            capture.stop()
+        self.frame_captures = []
+        if self.input_state:
+            self.input_state.destroy()
+        if self.gc_control:
+            self.gc_control.disable()
+        if self.recorder:
+            # writes out the rest of a recording, exit() ends with os._exit()
+            # so nothing else would
+            self.recorder.close()
+            self.recorder = None
+        if self._session_copy:
+            os.remove(self._session_copy)
+            self._session_copy = None
+
+        if 'loader' in self.__dict__:
             self.loader.destroy()
             del self.loader
         if getattr(self, 'graphics_engine', None):
@@ -426,15 +968,115 @@ class PandaApp(object):
         if 'parent' in kwargs:
             parent=kwargs['parent']
             del kwargs['parent']
-            model=self.loader.load_model(*args, **kwargs)
+            model=self.load_model(*args, **kwargs)
             model.reparent_to(parent)
             return model
-        else:
-            return self.loader.load_model(*args, **kwargs)
+        plain = self._is_plain_load(args, kwargs)
+        if plain and self.asset_manifest:
+            self.asset_manifest.record('model', [str(args[0])])
+        if plain and Config['prefer-baked-assets']:
+            args = (self._get_baked_path(args[0]),)
+        if plain and self.asset_cache is not None:
+            return self.asset_cache.load_model(args[0])
+        return self.loader.load_model(*args, **kwargs)
+
+    def lerp(self, node_path, prop, duration, end, start=None, blend_type='noBlend',
+             loop=False, callback=None):
+        """Lerps the 'pos', 'hpr', 'scale' or 'color_scale' of the node_path to end,
+        like the Lerp*Intervals, but all of them are stepped at once (see batchlerp.py).
+        Returns a LerpHandle, handle.stop() stops it."""
+        return self.lerps.add(node_path, prop, duration, end, start, blend_type, loop, callback)
+
+    def add_job(self, generator, name=None, priority=0, callback=None):
+        """Runs the generator a step (up to the next yield) at a time, as many
+        steps per frame as fit into job-budget ms, see jobscheduler.py.
+        callback(job) is called when it's done. Returns a Job, job.cancel() stops it."""
+        return self.job_scheduler.add(generator, name, priority, callback)
+
+    def generate_geom(self, func, *args, **kwargs):
+        """Runs func(*args) in a worker process, it returns (vertices, indices)
+        as float32 and uint32 buffers, the data comes back through shared memory
+        and is made into a GeomNode on the main thread (see procgen.py).
+        Keywords: parent, callback(handle), vertex_format ('v3n3' by default) and name.
+        Returns a LoadHandle, handle.result() is the NodePath."""
+        return self.procgen.submit(func, args, **kwargs)
+
+    def start_capture(self, writer, output=None, every=1, max_frames=0, num_buffers=None):
+        """Captures the frames rendered to output (the main window by default,
+        or any buffer) and hands them to writer on a background thread,
+        writer is eg. framecapture.ImageWriter('shots/frame_{0:05d}.png'),
+        with max_frames=1 it takes a single shot. Frames are dropped, not
+        waited for, when the writer is behind (see framecapture.py).
+        Returns the FrameCapture, capture.stop() ends it."""
+        if output is None:
+            output = self.win
+            if output is None:
+                raise RuntimeError('There is no window to capture (window-type none, or it failed to open), '
+                                   'pass an output buffer')
+        if num_buffers is None:
+            num_buffers = Config['capture-buffers']
+        capture = FrameCapture(output, writer, num_buffers, every, max_frames, self.frame_stats)
+        self.frame_captures.append(capture)
+        return capture
+
+    def get_vertex_view(self, source, column='vertex', geom_index=0):
+        """Returns a writable numpy view (rows x components) of a vertex column,
+        source is a GeomVertexData or a NodePath (see arrayviews.py),
+        get a new one each frame you write to it"""
+        import arrayviews
+        return arrayviews.get_vertex_view(source, column, geom_index)
+
+    def get_texture_view(self, tex, mipmap=0):
+        """Returns a writable numpy view of the texture's ram image,
+        (y, x, components) BGR(A), bottom row first (see arrayviews.py)"""
+        import arrayviews
+        return arrayviews.get_texture_view(tex, mipmap)
+
+    def update_vertices(self, source, values, column='vertex', start=0, geom_index=0):
+        """Writes a block of rows into a vertex column, from row start on"""
+        import arrayviews
+        arrayviews.update_vertices(source, values, column, start, geom_index)
+
+    def update_texture(self, tex, values, x=0, y=0, z=0):
+        """Writes a (height, width, components) block of pixels into the texture at x, y"""
+        import arrayviews
+        arrayviews.update_texture(tex, values, x, y, z)
+
+    def load_model_instanced(self, model_path, transforms, parent=None, shader=None, **kwargs):
+        """Loads a model and draws it once for each of the transforms with
+        hardware instancing (see instancing.py), returns an InstanceGroup,
+        it's node_path is the single node for all the instances and
+        set_transforms() updates them in bulk. shader replaces the built-in
+        one (which has per pixel lighting, no specular, fog or shadows)"""
+        from instancing import InstanceGroup
+        return InstanceGroup(self.load_model(model_path, **kwargs), transforms, parent, shader)
 
     def load_tex(self, *args, **kwargs):
+        plain = self._is_plain_load(args, kwargs)
+        if plain and self.asset_manifest:
+            self.asset_manifest.record('tex', [str(args[0])])
+        if plain and Config['prefer-baked-assets']:
+            args = (self._get_baked_path(args[0]),)
+        if plain and self.asset_cache is not None:
+            return self.asset_cache.load_tex(args[0])
         return self.loader.load_texture(*args, **kwargs)
 
+    def _get_baked_path(self, path):
+        #imported here, bake.py is mostly the offline baker
+        from bake import get_baked_path
+        return get_baked_path(path)
+
+    def _is_plain_load(self, args, kwargs):
+        #only single file loads with no options go through the cache and the manifest
+        return len(args) == 1 and not kwargs and isinstance(args[0], (str, Filename))
+
+    def get_asset_cache_stats(self):
+        """Returns the hits, misses, evictions and resident bytes of the
+        asset cache, or None if asset-cache-mb is 0"""
+        if self.asset_cache is None:
+            return None
+        return self.asset_cache.get_stats()
+
     def load_sound(self, *args, **kwargs):
         return self.loader.load_sound(*args, **kwargs)
 
@@ -444,29 +1086,35 @@ class PandaApp(object):
     def load_shader(self, *args, **kwargs):
         return self.loader.load_shader(*args, **kwargs)
 
-    @lru_cache(maxsize=64)
+    #Async versions, these return a LoadHandle (see asyncloader.py)
+    #and take extra keywords: priority (higher loads first), callback(handle)
+    #and for models parent (reparented on the main thread)
+    def _load_async(self, func, args, kwargs):
+        #the loader is made on first use, that must not happen on a loader thread
+        self.loader
+        self.asset_cache
+        return self.async_loader.load(func, args, kwargs)
+
+    def load_model_async(self, *args, **kwargs):
+        return self._load_async(self.load_model, args, kwargs)
+
+    def load_tex_async(self, *args, **kwargs):
+        return self._load_async(self.load_tex, args, kwargs)
+
+    def load_font_async(self, *args, **kwargs):
+        return self._load_async(self.load_font, args, kwargs)
+
+    def load_shader_async(self, *args, **kwargs):
+        return self._load_async(self.load_shader, args, kwargs)
+
     def load_glsl_shader(self, v_shader, f_shader, define=None, version='#version 140'):
-        # load the shader text
-        with open(getModelPath().find_file(v_shader).to_os_specific()) as f:
-            v_shader_txt = f.read()
-        with open(getModelPath().find_file(f_shader).to_os_specific()) as f:
-            f_shader_txt = f.read()
-        # make the header
-        if define:
-            header = version + '\n'
-            for name, value in define.items():
-                header += '#define {0} {1}\n'.format(name, value)
-            # put the header on top
-            v_shader_txt = v_shader_txt.replace(version, header)
-            f_shader_txt = f_shader_txt.replace(version, header)
-        # make the shader
-        shader = Shader.make(Shader.SL_GLSL, v_shader_txt, f_shader_txt)
-        try:
-            shader.set_filename(Shader.ST_vertex, v_shader)
-            shader.set_filename(Shader.ST_fragment, f_shader)
-        except:
-            print('Shader filenames will not be available, consider using a dev version of Panda3D')
-        return shader
+        """Loads a GLSL shader, with define (a dict of name:value) put in as
+        #define lines after the version line. The variants are cached,
+        see self.shader_cache.cache_info() for hits, misses and evictions."""
+        if self.asset_manifest:
+            self.asset_manifest.record('shader', [str(v_shader), str(f_shader),
+                                                  [list(i) for i in make_define_key(define)], version])
+        return self.shader_cache.get(v_shader, f_shader, define, version)
 
     def get_mouse(self):
         if self.mouse_watcher_node.has_mouse():
@@ -518,38 +1166,60 @@ class PandaApp(object):
         return self.messenger.isIgnoring(event, self)
 
     #This function must be used if you want a managed task
+    #group is optional, tasks in a group can be paused/resumed/removed together
     def add_task(self, *args, **kwargs):
-        if(not hasattr(self,"_taskList")):
-            self._taskList = {}
+        group = kwargs.pop('group', None)
         kwargs['owner']=self
+        args, kwargs = self._wrap_task_args(0, args, kwargs, group)
         task = self.task_mgr.add(*args, **kwargs)
+        if group is not None:
+            self.task_registry.set_group(task, group)
         return task
 
     def do_method_later(self, *args, **kwargs):
-        if(not hasattr(self,"_taskList")):
-            self._taskList ={}
+        group = kwargs.pop('group', None)
         kwargs['owner']=self
+        args, kwargs = self._wrap_task_args(1, args, kwargs, group)
         task = self.task_mgr.doMethodLater(*args, **kwargs)
+        if group is not None:
+            self.task_registry.set_group(task, group)
         return task
 
+    def add_fixed_task(self, func, name, sort=0, extraArgs=[]):
+        """Calls func(*extraArgs, dt) at the fixed-step-rate (see fixedstep.py),
+        use self.fixed_step.alpha to interpolate between steps when rendering"""
+        self.fixed_step.add(func, name, sort, extraArgs)
+
+    def remove_fixed_task(self, name):
+        self.fixed_step.remove(name)
+
     def remove_task(self, taskOrName):
         if type(taskOrName) == type(''):
-            # we must use a copy, since task.remove will modify self._taskList
-            if hasattr(self, '_taskList'):
-                taskListValues = list(self._taskList.values())
-                for task in taskListValues:
-                    if task.name == taskOrName:
-                        task.remove()
+            self.task_registry.remove(taskOrName)
         else:
-            taskOrName.remove()
+            self.task_registry.remove_task(taskOrName)
 
     def remove_all_tasks(self):
-        if hasattr(self,'_taskList'):
-            for task in list(self._taskList.values()):
-                task.remove()
+        self.task_registry.remove_all()
+
+    def pause_task_group(self, group):
+        """Takes all the tasks in the group out of the task manager"""
+        self.task_registry.pause_group(group)
+
+    def resume_task_group(self, group):
+        """Puts paused tasks of the group back into the task manager"""
+        self.task_registry.resume_group(group)
+
+    def remove_task_group(self, group):
+        """Removes all tasks in the group, running or paused"""
+        self.task_registry.remove_group(group)
+
+    def get_task_group_stats(self, group):
+        """Returns {'calls': n, 'seconds': total, 'paused': number of paused tasks}"""
+        return self.task_registry.get_group_stats(group)
 
     def _addTask(self, task):
-        self._taskList[task.id] = task
+        self.task_registry.add(task)
 
     def _clearTask(self, task):
-        del self._taskList[task.id]
+        self.task_registry.clear(task)
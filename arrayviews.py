@@ -0,0 +1,130 @@
+"""NumPy views of vertex data and texture images, for PandaApp.
+
+get_vertex_view() returns a writable numpy array (rows x components) of
+one column of a GeomVertexData, get_texture_view() one of a texture's ram
+image ((y, x, components), or (z, y, x, components) for 3d textures and
+arrays). Both look straight at Panda's memory, nothing gets copied, so
+view[:, 2] += 1.0 moves all the vertices up at numpy speed instead of a
+GeomVertexWriter loop. Keep in mind that Panda keeps the channels of a
+texture in BGR(A) order and the rows bottom up.
+
+Getting a view marks the array (or the image) as modified, so Panda will
+upload it again, get a new view each frame you write to it, don't keep one
+around, Panda may have moved the data in the meantime (copy on write).
+update_vertices() and update_texture() write a block of rows or a
+rectangle of pixels in one go. Panda 1.10 keeps the modified state per
+vertex array and per texture image, not per byte range, so what they
+save is touching only the one array (or image) and only the rows that
+change, and marking it modified once, not once per row.
+"""
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from panda3d.core import GeomEnums, GeomVertexData, Texture, InternalName, NodePath
+
+__all__ = ['get_vertex_data', 'get_vertex_view', 'get_texture_view',
+           'update_vertices', 'update_texture']
+
+_NUMERIC_TYPES = {GeomEnums.NT_uint8: 'uint8', GeomEnums.NT_uint16: 'uint16',
+                  GeomEnums.NT_uint32: 'uint32', GeomEnums.NT_int8: 'int8',
+                  GeomEnums.NT_int16: 'int16', GeomEnums.NT_int32: 'int32',
+                  GeomEnums.NT_float32: 'float32', GeomEnums.NT_float64: 'float64',
+                  GeomEnums.NT_packed_dcba: 'uint32', GeomEnums.NT_packed_dabc: 'uint32',
+                  GeomEnums.NT_packed_ufloat: 'uint32'}
+
+_COMPONENT_TYPES = {Texture.T_unsigned_byte: 'uint8', Texture.T_unsigned_short: 'uint16',
+                    Texture.T_float: 'float32', Texture.T_half_float: 'float16',
+                    Texture.T_byte: 'int8', Texture.T_short: 'int16',
+                    Texture.T_int: 'int32', Texture.T_unsigned_int: 'uint32',
+                    Texture.T_unsigned_int_24_8: 'uint32'}
+
+def _need_numpy():
+    if numpy is None:
+        raise ImportError('The array views need numpy')
+
+def get_vertex_data(source, geom_index=0):
+    """Returns a GeomVertexData that can be modified, source can be one or a
+    NodePath (the geom_index-th Geom of the first GeomNode at or under it,
+    made unique to that node, so other copies of the model are left alone)"""
+    if isinstance(source, GeomVertexData):
+        return source
+    if isinstance(source, NodePath):
+        if not source.node().is_geom_node():
+            found = source.find('**/+GeomNode')
+            if found.is_empty():
+                raise ValueError('No GeomNode under {0}'.format(source))
+            source = found
+        return source.node().modify_geom(geom_index).modify_vertex_data()
+    raise TypeError('Expected a GeomVertexData or a NodePath, got {0!r}'.format(source))
+
+def _find_column(vdata, column):
+    name = InternalName.make(column)
+    vformat = vdata.get_format()
+    array_index = vformat.get_array_with(name)
+    if array_index < 0:
+        raise ValueError('No {0!r} column in {1}'.format(column, vdata.get_name()))
+    array_format = vformat.get_array(array_index)
+    return array_index, array_format, array_format.get_column(name)
+
+def _column_dtype(column):
+    numeric_type = column.get_numeric_type()
+    if numeric_type == GeomEnums.NT_stdfloat:
+        return 'float64' if column.get_component_bytes() == 8 else 'float32'
+    return _NUMERIC_TYPES[numeric_type]
+
+def get_vertex_view(source, column='vertex', geom_index=0):
+    """Returns a writable (rows, components) numpy view of the column"""
+    _need_numpy()
+    vdata = get_vertex_data(source, geom_index)
+    array_index, array_format, col = _find_column(vdata, column)
+    data = memoryview(vdata.modify_array(array_index)).cast('B')
+    dtype = numpy.dtype(_column_dtype(col))
+    return numpy.ndarray((vdata.get_num_rows(), col.get_num_components()), dtype, data,
+                         offset=col.get_start(),
+                         strides=(array_format.get_stride(), dtype.itemsize))
+
+def update_vertices(source, values, column='vertex', start=0, geom_index=0):
+    """Writes values (rows x components) into the column from row start on"""
+    _need_numpy()
+    vdata = get_vertex_data(source, geom_index)
+    array_index, array_format, col = _find_column(vdata, column)
+    dtype = numpy.dtype(_column_dtype(col))
+    values = numpy.asarray(values, dtype).reshape(-1, col.get_num_components())
+    stride = array_format.get_stride()
+    if col.get_start() == 0 and col.get_total_bytes() == stride:
+        #the column has the array to itself, the rows are one contiguous block
+        if start + len(values) > vdata.get_num_rows():
+            raise IndexError('Rows {0}-{1} out of range'.format(start, start + len(values)))
+        handle = vdata.modify_array_handle(array_index)
+        handle.copy_subdata_from(start * stride, values.nbytes, numpy.ascontiguousarray(values))
+        return
+    view = get_vertex_view(vdata, column)
+    view[start:start + len(values)] = values
+
+def get_texture_view(tex, mipmap=0):
+    """Returns a writable numpy view of the texture's ram image,
+    (y, x, components) for 2d textures, (z, y, x, components) for the rest"""
+    _need_numpy()
+    if not tex.has_ram_image():
+        #reloads it from disk, if it was dropped after going to the gpu
+        tex.get_ram_image()
+    if tex.get_ram_image_compression() != Texture.CM_off:
+        raise ValueError('Texture {0} is compressed'.format(tex.get_name()))
+    image = tex.modify_ram_mipmap_image(mipmap) if mipmap else tex.modify_ram_image()
+    dtype = numpy.dtype(_COMPONENT_TYPES[tex.get_component_type()])
+    x = max(1, tex.get_x_size() >> mipmap)
+    y = max(1, tex.get_y_size() >> mipmap)
+    z = tex.get_z_size() if tex.get_texture_type() != Texture.TT_3d_texture else max(1, tex.get_z_size() >> mipmap)
+    array = numpy.frombuffer(memoryview(image).cast('B'), dtype).reshape(z, y, x, tex.get_num_components())
+    return array[0] if z == 1 else array
+
+def update_texture(tex, values, x=0, y=0, z=0):
+    """Writes values (a (height, width, components) block) into the texture at x, y"""
+    view = get_texture_view(tex)
+    if view.ndim == 4:
+        view = view[z]
+    values = numpy.asarray(values, view.dtype)
+    view[y:y + values.shape[0], x:x + values.shape[1]] = values.reshape(
+        values.shape[0], values.shape[1], -1)
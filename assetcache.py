@@ -0,0 +1,163 @@
+"""Memory budgeted cache for the models and textures loaded by PandaApp.
+
+With 'asset-cache-mb' above 0, load_model() and load_tex() go through
+this cache instead of leaving everything in Panda's ModelPool and
+TexturePool forever. Each asset gets an approximate size (vertex and
+index data for models, texture memory plus the ram image for textures)
+and when the total goes over the budget the least recently used assets
+that nobody references any more are released.
+
+A model counts as referenced as long as any copy returned by load_model()
+still exists, a texture as long as something (a node, or a Python
+variable) holds it beyond the cache and the TexturePool.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+from panda3d.core import NodePath, WeakNodePath, LoaderOptions, TexturePool, Filename
+
+__all__ = ['AssetCache']
+
+class _Entry(object):
+    def __init__(self, kind, asset, size):
+        self.kind = kind
+        self.asset = asset
+        self.size = size
+        self.copies = []
+        self.base_refs = asset.get_ref_count() if kind == 'tex' else 0
+
+    def is_referenced(self):
+        if self.kind == 'model':
+            self.copies = [copy for copy in self.copies if not copy.was_deleted()]
+            return bool(self.copies)
+        #the entry and getrefcount() hold the wrapper, anything more is a user
+        return self.asset.get_ref_count() > self.base_refs or sys.getrefcount(self.asset) > 2
+
+class AssetCache(object):
+    def __init__(self, loader, budget_bytes):
+        self.loader = loader
+        self.budget = budget_bytes
+        self.entries = OrderedDict()
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+
+    def load_model(self, model_path):
+        """Returns a new copy of the model, loading it if it's not in the cache"""
+        key = ('model', self._get_key(model_path, True))
+        with self.lock:
+            entry = self._get(key)
+        if entry is None:
+            #the cache replaces the ModelPool, but the bam cache on disk is fine
+            options = LoaderOptions(LoaderOptions.LF_search |
+                                    LoaderOptions.LF_report_errors |
+                                    LoaderOptions.LF_no_ram_cache)
+            model = self.loader.load_model(model_path, loaderOptions=options)
+            if model is None:
+                return None
+            entry = self._add(key, _Entry('model', model, _model_size(model)))
+            copy = entry.asset.copy_to(NodePath())
+            with self.lock:
+                entry.copies.append(WeakNodePath(copy))
+            #not before there is a copy, or the new model would be the first to go
+            self.trim()
+            return copy
+        copy = entry.asset.copy_to(NodePath())
+        with self.lock:
+            entry.copies.append(WeakNodePath(copy))
+        return copy
+
+    def load_tex(self, texture_path):
+        """Returns the texture, loading it if it's not in the cache"""
+        key = ('tex', self._get_key(texture_path, False))
+        with self.lock:
+            entry = self._get(key)
+        if entry is None:
+            tex = self.loader.load_texture(texture_path)
+            if tex is None:
+                return None
+            entry = self._add(key, _Entry('tex', tex, _texture_size(tex)))
+            self.trim()
+        return entry.asset
+
+    def trim(self, budget=None):
+        """Releases unreferenced assets, least recently used first,
+        until the resident size is within the budget"""
+        budget = self.budget if budget is None else budget
+        with self.lock:
+            if self.resident_bytes <= budget:
+                return
+            for key, entry in list(self.entries.items()):
+                if self.resident_bytes <= budget:
+                    break
+                if entry.is_referenced():
+                    continue
+                del self.entries[key]
+                self.resident_bytes -= entry.size
+                self.evictions += 1
+                if entry.kind == 'tex':
+                    TexturePool.release_texture(entry.asset)
+                    entry.asset.release_all()
+                else:
+                    entry.asset.remove_node()
+
+    def clear(self):
+        """Releases all unreferenced assets"""
+        self.trim(0)
+
+    def get_stats(self):
+        with self.lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'resident_bytes': self.resident_bytes,
+                    'budget_bytes': self.budget,
+                    'assets': len(self.entries)}
+
+    def _get_key(self, path, model):
+        """Full path of the file the loader finds, so 'box' and 'box.egg'
+        (or 'box.egg.pz' on disk) are the same asset"""
+        from bake import find_asset
+        found = find_asset(path, model)
+        return Filename(path).get_fullpath() if found is None else found.get_fullpath()
+
+    def _get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        #pop and put back, OrderedDict has no move_to_end() on py2
+        self.entries[key] = self.entries.pop(key)
+        self.hits += 1
+        return entry
+
+    def _add(self, key, entry):
+        with self.lock:
+            #an other thread may have loaded it in the meantime
+            if key in self.entries:
+                return self.entries[key]
+            self.entries[key] = entry
+            self.resident_bytes += entry.size
+        return entry
+
+def _model_size(model):
+    """Approximate size of the vertex and index data of a model"""
+    size = 0
+    for geom_np in model.find_all_matches('**/+GeomNode'):
+        for geom in geom_np.node().get_geoms():
+            vdata = geom.get_vertex_data()
+            for i in range(vdata.get_num_arrays()):
+                size += vdata.get_array(i).get_data_size_bytes()
+            for prim in geom.get_primitives():
+                size += prim.get_data_size_bytes()
+    return size
+
+def _texture_size(tex):
+    """Approximate size of a texture, on the gpu and in ram"""
+    size = tex.estimate_texture_memory()
+    if tex.has_ram_image():
+        size += tex.get_ram_image_size()
+    return size
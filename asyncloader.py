@@ -0,0 +1,162 @@
+"""Asset loading off the main thread for PandaApp.
+
+Loads run as tasks on a threaded task chain, at most 'async-load-threads'
+of them at once, the rest wait in a queue sorted by priority.
+Finished loads are picked up by a task on the main thread (started by
+PandaApp.restart()) that reparents them and runs the callbacks, at most
+'async-load-attach-per-frame' of them per frame (0 means no limit).
+"""
+import heapq
+import itertools
+from collections import deque
+
+from direct.task import Task
+
+from awaitable import Waiter
+
+__all__ = ['AsyncLoader', 'LoadHandle']
+
+class LoadHandle(object):
+    """A pending load, returned by the PandaApp.load_*_async() functions.
+    It can be awaited in a coroutine task, or polled with done()."""
+    PENDING, LOADING, FINISHED, CANCELLED = range(4)
+
+    def __init__(self, func, args, kwargs, parent=None, priority=0, callback=None):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.parent = parent
+        self.priority = priority
+        self.state = LoadHandle.PENDING
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        if callback is not None:
+            self._callbacks.append(callback)
+
+    def done(self):
+        """True if the load finished or got cancelled"""
+        return self.state in (LoadHandle.FINISHED, LoadHandle.CANCELLED)
+
+    def cancelled(self):
+        return self.state == LoadHandle.CANCELLED
+
+    def cancel(self):
+        """Cancels the load, returns False if it's already done.
+        A load that already started still runs, but the result is dropped."""
+        if self.done():
+            return False
+        self.state = LoadHandle.CANCELLED
+        self._run_callbacks()
+        return True
+
+    def result(self):
+        """Returns the loaded asset (None if cancelled), re-raises if the load failed"""
+        if not self.done():
+            raise RuntimeError('Load not finished')
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        return self._exception
+
+    def add_done_callback(self, callback):
+        """callback(handle) is called on the main thread once the load is done"""
+        if self.done():
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def _finish(self):
+        """Called on the main thread when the load is over"""
+        if self.state == LoadHandle.CANCELLED:
+            return
+        if self._exception is None and self.parent is not None and self._result is not None:
+            self._result.reparent_to(self.parent)
+        self.state = LoadHandle.FINISHED
+        self._run_callbacks()
+
+    def _run_callbacks(self):
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def __await__(self):
+        return Waiter(self)
+
+class AsyncLoader(object):
+    """Runs load functions on a threaded task chain, with priorities and a cap"""
+    def __init__(self, task_mgr, num_threads=2, attach_per_frame=0, chain_name='async_load_chain'):
+        self.task_mgr = task_mgr
+        self.max_loading = max(1, num_threads)
+        self.attach_per_frame = attach_per_frame
+        self.chain_name = chain_name
+        self.task_mgr.setupTaskChain(chain_name, numThreads=self.max_loading, frameSync=False)
+        self._queue = []
+        self._seq = itertools.count()
+        self._num_loading = 0
+        #appended on the loader threads, popped on the main thread
+        self._loaded = deque()
+        self._to_attach = deque()
+
+    def load(self, func, args, kwargs):
+        """Queues func(*args, **kwargs), returns a LoadHandle.
+        The 'parent', 'priority' and 'callback' keywords are taken out of kwargs,
+        higher priority loads start first."""
+        kwargs = dict(kwargs)
+        parent = kwargs.pop('parent', None)
+        priority = kwargs.pop('priority', 0)
+        callback = kwargs.pop('callback', None)
+        handle = LoadHandle(func, args, kwargs, parent, priority, callback)
+        heapq.heappush(self._queue, (-priority, next(self._seq), handle))
+        self._start_loads()
+        return handle
+
+    def get_num_pending(self):
+        """Returns the number of loads not yet started"""
+        return sum(1 for item in self._queue if not item[2].cancelled())
+
+    def get_num_loading(self):
+        return self._num_loading
+
+    def cancel_all(self):
+        for item in self._queue:
+            item[2].cancel()
+        for handle in list(self._to_attach) + list(self._loaded):
+            handle.cancel()
+        self._queue = []
+
+    def update(self, task=None):
+        """Attaches finished loads and starts new ones, runs every frame on the main thread"""
+        while self._loaded:
+            self._to_attach.append(self._loaded.popleft())
+            self._num_loading -= 1
+        attached = 0
+        while self._to_attach:
+            if self.attach_per_frame and attached >= self.attach_per_frame:
+                break
+            self._to_attach.popleft()._finish()
+            attached += 1
+        self._start_loads()
+        return Task.cont
+
+    def _start_loads(self):
+        while self._queue and self._num_loading < self.max_loading:
+            handle = heapq.heappop(self._queue)[2]
+            if handle.cancelled():
+                continue
+            handle.state = LoadHandle.LOADING
+            self._num_loading += 1
+            self.task_mgr.add(self._load_task, 'async_load', extraArgs=[handle],
+                              taskChain=self.chain_name)
+
+    def _load_task(self, handle):
+        """Runs on one of the loader threads"""
+        if not handle.cancelled():
+            try:
+                handle._result = handle.func(*handle.args, **handle.kwargs)
+            except Exception as e:
+                handle._exception = e
+        self._loaded.append(handle)
+        return Task.done
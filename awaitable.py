@@ -0,0 +1,23 @@
+"""await support for the handles PandaApp returns (LoadHandle, Job).
+
+__await__ can't be a generator that returns the result, that's a
+SyntaxError on py2 and these modules still have to import there, so it
+returns a Waiter instead.
+"""
+__all__ = ['Waiter']
+
+class Waiter(object):
+    """Iterator for __await__, yields None (so a coroutine task waits a
+    frame) until handle.done(), then stops with handle.result()"""
+    def __init__(self, handle):
+        self.handle = handle
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.handle.done():
+            return None
+        raise StopIteration(self.handle.result())
+
+    next = __next__
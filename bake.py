@@ -0,0 +1,206 @@
+"""Offline asset baking, models to .bam and textures to compressed .txo.
+
+Run from the project root (or anywhere with the prc files you use):
+python -m bake [dirs...] [-j jobs] [--no-compress] [--force]
+
+Without dirs it bakes the directories on the model-path. Each model
+(egg, gltf, obj, ...) gets a .bam and each texture (png, jpg, tga, ...)
+a .txo (with mipmaps, and compressed if Panda was built with squish)
+next to the source file, eg. 'models/box.egg' -> 'models/box.bam'.
+The work is spread over a process pool. A sha1 of each source is kept in
+'.bake_hashes.json' in every baked dir, so only files that changed (or
+lost their baked file) are done again.
+
+PandaApp.load_model()/load_tex() pick the baked file over the source
+when it's not older than the source ('prefer-baked-assets', on by default).
+The path is resolved like Panda's loader does (no extension means
+'default-model-extension', 'box.egg' may be 'box.egg.pz' on disk) and the
+answer is kept per path, call clear_baked_paths() after baking while
+running.
+"""
+from __future__ import print_function
+import hashlib
+import json
+import os
+import sys
+
+from panda3d.core import Filename, getModelPath, ConfigVariableString
+
+__all__ = ['bake', 'get_baked_path', 'clear_baked_paths', 'find_asset', 'MODEL_EXTENSIONS', 'TEXTURE_EXTENSIONS']
+
+MODEL_EXTENSIONS = ('egg', 'gltf', 'glb', 'obj', 'dae', 'fbx', 'x')
+TEXTURE_EXTENSIONS = ('png', 'jpg', 'jpeg', 'tga', 'bmp', 'tif', 'tiff')
+#compressed sources, eg. 'box.egg.pz'
+_ZIP_EXTENSIONS = ('pz', 'gz')
+HASH_FILE = '.bake_hashes.json'
+#str(path): baked Filename, or None if there's none
+_baked_paths = {}
+
+def _split_extension(path):
+    """Returns (path without the extensions, extension) of a path,
+    'box.egg.pz' gives ('box', 'egg')"""
+    base, ext = os.path.splitext(path)
+    if ext[1:].lower() in _ZIP_EXTENSIONS:
+        base, ext = os.path.splitext(base)
+    return base, ext[1:].lower()
+
+def _get_baked_extension(ext):
+    if ext in MODEL_EXTENSIONS:
+        return 'bam'
+    if ext in TEXTURE_EXTENSIONS:
+        return 'txo'
+    return None
+
+def get_baked_path(path):
+    """Returns the baked version of the model or texture at path (as a
+    Filename) if there is one that's not older than the source, else path"""
+    key = str(path)
+    try:
+        baked = _baked_paths[key]
+    except KeyError:
+        baked = _baked_paths[key] = _find_baked(key)
+    return path if baked is None else baked
+
+def clear_baked_paths():
+    """Forgets what get_baked_path() found"""
+    _baked_paths.clear()
+
+def find_asset(path, model=True):
+    """Returns the file on the model-path the loader would load for path
+    (a Filename), or None if there's none. A model without an extension
+    gets 'default-model-extension' and 'box.egg' may be 'box.egg.pz'."""
+    fullpath = Filename(path).get_fullpath()
+    if model and not os.path.splitext(fullpath)[1]:
+        fullpath += ConfigVariableString('default-model-extension', '').get_value()
+    model_path = getModelPath()
+    for candidate in [fullpath] + [fullpath + '.' + zip_ext for zip_ext in _ZIP_EXTENSIONS]:
+        found = model_path.find_file(Filename(candidate))
+        if not found.empty():
+            return found
+    return None
+
+def _find_baked(path):
+    found = find_asset(path)
+    if found is None:
+        return None
+    base, ext = _split_extension(found.get_fullpath())
+    baked_ext = _get_baked_extension(ext)
+    if baked_ext is None:
+        return None
+    baked = Filename(base + '.' + baked_ext)
+    if baked.exists() and baked.get_timestamp() >= found.get_timestamp():
+        return baked
+    return None
+
+def _hash_file(path, options):
+    digest = hashlib.sha1(options.encode('utf-8'))
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _bake_model(src, dst):
+    from panda3d.core import Loader, LoaderOptions, NodePath
+    options = LoaderOptions(LoaderOptions.LF_report_errors | LoaderOptions.LF_no_cache)
+    node = Loader.get_global_ptr().load_sync(Filename.from_os_specific(src), options)
+    if node is None:
+        raise IOError('Could not load model ' + src)
+    if not NodePath(node).write_bam_file(Filename.from_os_specific(dst)):
+        raise IOError('Could not write ' + dst)
+
+def _bake_texture(src, dst, compress):
+    from panda3d.core import TexturePool, LoaderOptions, Texture
+    options = LoaderOptions(LoaderOptions.LF_report_errors | LoaderOptions.LF_no_cache)
+    tex = TexturePool.load_texture(Filename.from_os_specific(src), 0, False, options)
+    if tex is None:
+        raise IOError('Could not load texture ' + src)
+    tex.generate_ram_mipmap_images()
+    if compress:
+        #needs Panda built with squish, the txo is left uncompressed if not
+        tex.compress_ram_image(Texture.CM_on)
+    if not tex.write(Filename.from_os_specific(dst)):
+        raise IOError('Could not write ' + dst)
+
+def _bake_one(src, dst, compress):
+    """Runs in the worker processes, returns (src, error or None)"""
+    try:
+        if dst.endswith('.bam'):
+            _bake_model(src, dst)
+        else:
+            _bake_texture(src, dst, compress)
+    except Exception as e:
+        return src, str(e)
+    return src, None
+
+def _find_sources(directory):
+    """Yields (source path, baked path) for everything bakeable under directory"""
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            base, ext = _split_extension(os.path.join(root, name))
+            baked_ext = _get_baked_extension(ext)
+            if baked_ext is not None:
+                yield os.path.join(root, name), base + '.' + baked_ext
+
+def bake(directories, jobs=None, compress=True, force=False, log=print):
+    """Bakes all the models and textures under the directories,
+    returns (number baked, number skipped, {source: error})"""
+    options = 'compress' if compress else 'raw'
+    todo = []
+    skipped = 0
+    hash_files = {}
+    for directory in directories:
+        hash_path = os.path.join(directory, HASH_FILE)
+        try:
+            with open(hash_path) as f:
+                hashes = json.load(f)
+        except (IOError, OSError, ValueError):
+            hashes = {}
+        hash_files[hash_path] = hashes
+        for src, dst in _find_sources(directory):
+            key = os.path.relpath(src, directory)
+            digest = _hash_file(src, options)
+            if not force and hashes.get(key) == digest and os.path.exists(dst):
+                skipped += 1
+                continue
+            todo.append((src, dst, hash_path, key, digest))
+    errors = {}
+    if todo:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = pool.map(_bake_one, [src for src, dst, h, k, d in todo],
+                               [dst for src, dst, h, k, d in todo], [compress] * len(todo))
+            for (src, dst, hash_path, key, digest), (src, error) in zip(todo, results):
+                if error:
+                    errors[src] = error
+                    hash_files[hash_path].pop(key, None)
+                    log('FAILED {0}: {1}'.format(src, error))
+                else:
+                    hash_files[hash_path][key] = digest
+                    log('{0} -> {1}'.format(src, dst))
+    for hash_path, hashes in hash_files.items():
+        if hashes:
+            with open(hash_path, 'w') as f:
+                json.dump(hashes, f, indent=1, sort_keys=True)
+    clear_baked_paths()
+    return len(todo) - len(errors), skipped, errors
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Bake models to .bam and textures to .txo')
+    parser.add_argument('dirs', nargs='*', help='directories to bake (default: the model-path)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes (default: cpu count)')
+    parser.add_argument('--no-compress', action='store_true', help='keep the textures uncompressed')
+    parser.add_argument('--force', action='store_true', help='bake everything, changed or not')
+    args = parser.parse_args(argv)
+    dirs = args.dirs
+    if not dirs:
+        model_path = getModelPath().get_value()
+        dirs = [model_path.get_directory(i).to_os_specific()
+                for i in range(model_path.get_num_directories())]
+    dirs = [d for i, d in enumerate(dirs) if os.path.isdir(d) and d not in dirs[:i]]
+    baked, skipped, errors = bake(dirs, args.jobs, not args.no_compress, args.force)
+    print('baked {0}, up to date {1}, failed {2}'.format(baked, skipped, len(errors)))
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""Batched lerps for PandaApp, for when there are thousands of them.
+
+Every LerpPosInterval/LerpHprInterval is its own Python object and C++
+interval, stepped one by one by the ivalMgr. PandaApp.lerp() adds a lerp
+to self.lerps (a LerpBatch) instead, where the start and end values,
+start times, durations and blend types of all the lerps of one property
+(pos, hpr, scale or color_scale) sit in contiguous arrays. Each frame the
+interval_loop task evaluates all of them at once (with numpy, if it's
+there, else in a plain loop) into one row of values per node, and then
+sets them with one call per node (set_pos_hpr() for a node with a pos and
+a hpr lerp, and so on), making a new TransformState costs more than all
+the math, so that's the part worth saving on.
+
+That only pays off with a lot of lerps: benchmarks/lerp.py (a looping pos
+and hpr lerp per node, numpy installed) measured the interval_loop at
+about the same time as the ivalMgr for 1000 nodes (p50 2.3 vs 2.5 ms) and
+about a quarter less for 10000 (29 vs 39 ms, in an other run 30 vs 46 ms).
+
+Blend types are the same as for the intervals: 'noBlend', 'easeIn',
+'easeOut' and 'easeInOut'. A lerp with loop=True starts over when it
+ends, the others call their callback (if any) and are dropped.
+"""
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ['LerpBatch', 'LerpHandle', 'BLEND_TYPES']
+
+BLEND_TYPES = {'noBlend': 0, 'easeIn': 1, 'easeOut': 2, 'easeInOut': 3}
+#property: (index, first column in the per node row, number of components)
+PROPERTIES = {'pos': (0, 0, 3), 'hpr': (1, 3, 3), 'scale': (2, 6, 3), 'color_scale': (3, 9, 4)}
+ROW_SIZE = 13
+#setter calls for each combination of pos (1), hpr (2) and scale (4) lerps on a node,
+#as (method, first column, last column)
+_TRANSFORM_SETTERS = {0: (),
+                      1: (('set_pos', 0, 3),),
+                      2: (('set_hpr', 3, 6),),
+                      3: (('set_pos_hpr', 0, 6),),
+                      4: (('set_scale', 6, 9),),
+                      5: (('set_pos', 0, 3), ('set_scale', 6, 9)),
+                      6: (('set_hpr_scale', 3, 9),),
+                      7: (('set_pos_hpr_scale', 0, 9),)}
+
+def _blend(t, blend):
+    """Same curves as Panda's LerpBlendHelpers, for one value"""
+    if blend == 1:
+        t2 = t * t
+        return ((3.0 * t2) - (t2 * t)) * 0.5
+    if blend == 2:
+        return ((3.0 * t) - (t * t * t)) * 0.5
+    if blend == 3:
+        t2 = t * t
+        return (3.0 * t2) - (2.0 * t * t2)
+    return t
+
+class LerpHandle(object):
+    """A lerp in a LerpBatch, returned by PandaApp.lerp()"""
+    __slots__ = ('batch', 'channel', 'index', 'callback')
+
+    def __init__(self, batch, channel, callback=None):
+        self.batch = batch
+        self.channel = channel
+        self.index = None
+        self.callback = callback
+
+    def is_playing(self):
+        return self.index is not None
+
+    def stop(self):
+        """Stops the lerp where it is, without calling the callback"""
+        if self.index is not None:
+            self.batch._remove(self.channel, self.index)
+
+class _Channel(object):
+    """All the lerps of one property"""
+    def __init__(self, prop):
+        self.prop = prop
+        self.bit, self.column, self.size = PROPERTIES[prop]
+        self.count = 0
+        self.handles = []
+        self.capacity = 0
+        if numpy is not None:
+            self._resize(64)
+        else:
+            self.start, self.delta, self.start_time = [], [], []
+            self.inv_duration, self.blend, self.loop, self.node_slot = [], [], [], []
+
+    def _arrays(self):
+        return (self.start, self.delta, self.start_time, self.inv_duration,
+                self.blend, self.loop, self.node_slot)
+
+    def _resize(self, capacity):
+        def grow(old, shape, dtype):
+            new = numpy.zeros(shape, dtype)
+            if self.count:
+                new[:self.count] = old[:self.count]
+            return new
+        size = self.size
+        self.start = grow(getattr(self, 'start', None), (capacity, size), numpy.float64)
+        self.delta = grow(getattr(self, 'delta', None), (capacity, size), numpy.float64)
+        self.start_time = grow(getattr(self, 'start_time', None), capacity, numpy.float64)
+        self.inv_duration = grow(getattr(self, 'inv_duration', None), capacity, numpy.float64)
+        self.blend = grow(getattr(self, 'blend', None), capacity, numpy.int8)
+        self.loop = grow(getattr(self, 'loop', None), capacity, numpy.bool_)
+        self.node_slot = grow(getattr(self, 'node_slot', None), capacity, numpy.intp)
+        self.capacity = capacity
+
+    def add(self, handle, node_slot, start, end, start_time, duration, blend, loop):
+        i = self.count
+        row = (list(start), [e - s for s, e in zip(start, end)], start_time,
+               1.0 / max(duration, 1e-6), blend, loop, node_slot)
+        if numpy is not None:
+            if i >= self.capacity:
+                self._resize(self.capacity * 2)
+            for array, value in zip(self._arrays(), row):
+                array[i] = value
+        else:
+            for array, value in zip(self._arrays(), row):
+                array.append(value)
+        self.handles.append(handle)
+        handle.index = i
+        self.count += 1
+
+    def remove(self, i):
+        """Removes lerp i, the last one takes its place, returns the node slot it had"""
+        last = self.count - 1
+        node_slot = int(self.node_slot[i])
+        self.handles[i].index = None
+        if i != last:
+            for array in self._arrays():
+                array[i] = array[last]
+            self.handles[i] = self.handles[last]
+            self.handles[i].index = i
+        if numpy is None:
+            for array in self._arrays():
+                array.pop()
+        self.handles.pop()
+        self.count = last
+        return node_slot
+
+    def step(self, now, rows):
+        """Puts the values of all the lerps for time now into their node's row,
+        returns the indices of the lerps that ended"""
+        n = self.count
+        column, size = self.column, self.size
+        if numpy is not None:
+            t = (now - self.start_time[:n]) * self.inv_duration[:n]
+            loop = self.loop[:n]
+            finished = numpy.flatnonzero((t >= 1.0) & ~loop)
+            t = numpy.where(loop, t % 1.0, t)
+            numpy.clip(t, 0.0, 1.0, out=t)
+            blend = self.blend[:n]
+            if blend.any():
+                t2 = t * t
+                t = numpy.select([blend == 1, blend == 2, blend == 3],
+                                 [((3.0 * t2) - (t2 * t)) * 0.5,
+                                  ((3.0 * t) - (t2 * t)) * 0.5,
+                                  (3.0 * t2) - (2.0 * t * t2)], t)
+            rows[self.node_slot[:n], column:column + size] = self.start[:n] + self.delta[:n] * t[:, None]
+            return finished.tolist()
+        finished = []
+        for i in range(n):
+            t = (now - self.start_time[i]) * self.inv_duration[i]
+            if self.loop[i]:
+                t %= 1.0
+            elif t >= 1.0:
+                finished.append(i)
+            t = _blend(min(1.0, max(0.0, t)), self.blend[i])
+            rows[self.node_slot[i]][column:column + size] = [s + d * t for s, d in
+                                                            zip(self.start[i], self.delta[i])]
+        return finished
+
+class LerpBatch(object):
+    """All the batched lerps, get_time() gives the current (frame) time"""
+    def __init__(self, get_time):
+        self.get_time = get_time
+        self.channels = [_Channel(prop) for prop in sorted(PROPERTIES, key=lambda p: PROPERTIES[p][0])]
+        self._channels = dict((channel.prop, channel) for channel in self.channels)
+        #node slots, the lerps of a node all write into the same row
+        self._slots = {}
+        self._node_paths = []
+        self._counts = []
+        self._free_slots = []
+        self._rows = None
+        self._setters = None
+        self._resize_rows(64)
+
+    def add(self, node_path, prop, duration, end, start=None, blend_type='noBlend',
+            loop=False, callback=None):
+        """Lerps the prop ('pos', 'hpr', 'scale' or 'color_scale') of the
+        node_path from start (default: the current value) to end in duration
+        seconds, callback(handle) is called when it's done. Returns a LerpHandle."""
+        channel = self._channels.get(prop)
+        if channel is None:
+            raise ValueError('Can not lerp {0!r}, only {1}'.format(prop, ', '.join(sorted(PROPERTIES))))
+        if start is None:
+            start = getattr(node_path, 'get_' + prop)()
+        handle = LerpHandle(self, channel, callback)
+        channel.add(handle, self._get_slot(node_path, channel.bit), tuple(start), tuple(end),
+                    self.get_time(), duration, BLEND_TYPES[blend_type], loop)
+        return handle
+
+    def step(self, now=None):
+        """Updates all the lerps, PandaApp calls this in the interval_loop task"""
+        if not self._slots:
+            return
+        if now is None:
+            now = self.get_time()
+        rows = self._rows
+        finished = [(channel, channel.step(now, rows)) for channel in self.channels if channel.count]
+        if self._setters is None:
+            self._setters = self._make_setters()
+        if numpy is not None:
+            #no need to convert the color_scale columns if nothing uses them
+            columns = ROW_SIZE if self._channels['color_scale'].count else 9
+            rows = rows[:len(self._node_paths), :columns].tolist()
+        for setter, slot, first, last in self._setters:
+            setter(*rows[slot][first:last])
+        ended = []
+        for channel, indices in finished:
+            handles = [channel.handles[i] for i in indices]
+            for handle in handles:
+                self._remove(channel, handle.index)
+            ended.extend(handles)
+        for handle in ended:
+            if handle.callback is not None:
+                handle.callback(handle)
+
+    def get_num_lerps(self):
+        return sum(channel.count for channel in self.channels)
+
+    def clear(self):
+        """Stops all the lerps"""
+        for channel in self.channels:
+            while channel.count:
+                self._remove(channel, channel.count - 1)
+
+    def _remove(self, channel, i):
+        slot = channel.remove(i)
+        counts = self._counts[slot]
+        counts[channel.bit] -= 1
+        if not any(counts):
+            del self._slots[self._node_paths[slot]]
+            self._node_paths[slot] = None
+            self._free_slots.append(slot)
+        self._setters = None
+
+    def _get_slot(self, node_path, bit):
+        slot = self._slots.get(node_path)
+        if slot is None:
+            if self._free_slots:
+                slot = self._free_slots.pop()
+                self._node_paths[slot] = node_path
+            else:
+                slot = len(self._node_paths)
+                self._node_paths.append(node_path)
+                self._counts.append(None)
+                if slot >= len(self._rows):
+                    self._resize_rows(len(self._rows) * 2)
+            self._counts[slot] = [0, 0, 0, 0]
+            self._slots[node_path] = slot
+        self._counts[slot][bit] += 1
+        self._setters = None
+        return slot
+
+    def _resize_rows(self, size):
+        if numpy is not None:
+            rows = numpy.zeros((size, ROW_SIZE), numpy.float64)
+            if self._rows is not None:
+                rows[:len(self._rows)] = self._rows
+        else:
+            rows = self._rows or []
+            rows.extend([0.0] * ROW_SIZE for i in range(size - len(rows)))
+        self._rows = rows
+
+    def _make_setters(self):
+        """Returns (bound setter, slot, first column, last column) for all the nodes"""
+        setters = []
+        for slot, node_path in enumerate(self._node_paths):
+            if node_path is None:
+                continue
+            counts = self._counts[slot]
+            mask = (counts[0] and 1) | (counts[1] and 2) | (counts[2] and 4)
+            for name, first, last in _TRANSFORM_SETTERS[mask]:
+                setters.append((getattr(node_path, name), slot, first, last))
+            if counts[3]:
+                setters.append((node_path.set_color_scale, slot, 9, 13))
+        return setters
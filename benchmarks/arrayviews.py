@@ -0,0 +1,95 @@
+"""Benchmark of the numpy array views against GeomVertexWriter and PNMImage.
+
+Runs with no window, each frame moves every vertex of a count vertex
+'v3n3' mesh and fills a size x size rgba texture, once the usual way
+(a GeomVertexWriter loop, a PNMImage loaded into the texture) and once
+with get_vertex_view()/update_vertices() and get_texture_view(), and
+reports the time per frame (ms) as json.
+
+Run from the project root:
+python -m benchmarks.arrayviews [count] [size] [frames]
+eg. python -m benchmarks.arrayviews 100000 2048 20
+"""
+from __future__ import print_function
+import json
+import math
+import sys
+from array import array
+
+import numpy
+from panda3d.core import GeomVertexWriter, PNMImage, Texture
+
+from framestats import FrameStats
+from procgen import make_geom_node
+from arrayviews import get_vertex_data, get_vertex_view, update_vertices, get_texture_view
+
+def time_frames(frames, func):
+    stats = FrameStats(frames)
+    timed = stats.wrap(func, 'frame')
+    for frame in range(frames):
+        stats.begin_frame()
+        timed(frame)
+    stats.begin_frame()
+    return stats.get_percentiles('frame')
+
+def make_mesh(count):
+    vertices = array('f', [0.0]) * (count * 6)
+    indices = array('I', [0, 1, 2])
+    return make_geom_node('mesh', 'v3n3', memoryview(vertices).cast('B'), memoryview(indices).cast('B'))
+
+def run_vertices(count, frames):
+    mesh = make_mesh(count)
+    x = numpy.arange(count, dtype='float32')
+
+    def writer(frame):
+        vertex = GeomVertexWriter(get_vertex_data(mesh), 'vertex')
+        z = math.sin(frame * 0.1)
+        for i in range(count):
+            vertex.set_data3(i, 0.0, z)
+
+    def view(frame):
+        get_vertex_view(mesh)[:, 2] = math.sin(frame * 0.1)
+
+    def bulk(frame):
+        block = numpy.empty((count, 3), 'float32')
+        block[:, 0] = x
+        block[:, 1] = 0.0
+        block[:, 2] = math.sin(frame * 0.1)
+        update_vertices(mesh, block)
+
+    return {'vertex_writer': time_frames(frames, writer),
+            'vertex_view': time_frames(frames, view),
+            'update_vertices': time_frames(frames, bulk)}
+
+def run_texture(size, frames):
+    tex = Texture('benchmark')
+    tex.setup_2d_texture(size, size, Texture.T_unsigned_byte, Texture.F_rgba)
+    image = PNMImage(size, size, 4)
+
+    def pnm(frame):
+        #the fastest of the usual ways, a fill and a copy into the texture
+        image.fill(frame % 256 / 255.0, 0.5, 0.25)
+        image.alpha_fill(1.0)
+        tex.load(image)
+
+    def view(frame):
+        pixels = get_texture_view(tex)
+        pixels[..., 0] = 64
+        pixels[..., 1] = 128
+        pixels[..., 2] = frame % 256
+        pixels[..., 3] = 255
+
+    return {'pnm_image': time_frames(frames, pnm),
+            'texture_view': time_frames(frames, view)}
+
+def run(count=100000, size=2048, frames=20):
+    results = {'count': count, 'size': size}
+    results.update(run_vertices(count, frames))
+    results.update(run_texture(size, frames))
+    return results
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 2048
+    frames = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    print(json.dumps(run(count, size, frames), indent=2, sort_keys=True))
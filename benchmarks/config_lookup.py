@@ -0,0 +1,32 @@
+"""Microbenchmark of SimpleConfig lookups, cached vs. uncached.
+
+Run from the project root:
+python -m benchmarks.config_lookup [iterations]
+"""
+from __future__ import print_function
+import sys
+import timeit
+
+from simpleconfig import SimpleConfig as Config
+
+KEYS = ('win-size', 'sync-video', 'show-frame-rate-meter', 'model-path',
+        'default-far', 'background-color', 'window-title', 'not-a-config-var')
+
+def run(iterations=20000):
+    """Returns {key: (uncached_us, cached_us)} per lookup"""
+    results = {}
+    for key in KEYS:
+        Config[key] #fill the cache
+        uncached = timeit.timeit(lambda: Config._resolve(key), number=iterations)
+        cached = timeit.timeit(lambda: Config[key], number=iterations)
+        results[key] = (uncached * 1e6 / iterations, cached * 1e6 / iterations)
+    snapshot = timeit.timeit(lambda: Config.snapshot(KEYS), number=iterations)
+    results['snapshot({0} keys)'.format(len(KEYS))] = (None, snapshot * 1e6 / iterations)
+    return results
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print('{0:<28}{1:>14}{2:>14}'.format('key', 'uncached us', 'cached us'))
+    for key, (uncached, cached) in sorted(run(iterations).items()):
+        uncached = '-' if uncached is None else '{0:.3f}'.format(uncached)
+        print('{0:<28}{1:>14}{2:>14.3f}'.format(key, uncached, cached))
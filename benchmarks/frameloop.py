@@ -0,0 +1,203 @@
+"""Benchmark suite of the PandaApp frame loop, headless.
+
+Starts one PandaApp with an offscreen window (p3tinydisplay by default,
+so it needs no gpu) and runs each scenario for every count:
+
+    nodes      count cards under render, a few of them moved each frame
+    tasks      count tasks added with add_task()
+    events     count messenger events sent (and accepted) per frame
+    intervals  count looping LerpPosIntervals
+    config     count SimpleConfig lookups per frame
+    load_model count load_model() calls per frame (a copy of the model
+               that's removed right away), once with the asset cache on
+               ('load_model_cached') and once without
+
+Each scenario gets a few warm up frames and then frames frames, the
+results are the frame time and the time of each task that ran (p50, p95,
+p99, mean and max, in ms, see framestats.py) as json, so a change to the
+restart() task pipeline can be compared before and after.
+
+Run from the project root:
+python -m benchmarks.frameloop [scenario ...] [--counts 100,1000,10000] [--frames 200] [--output file]
+eg. python -m benchmarks.frameloop tasks events --counts 1000 --frames 500
+"""
+from __future__ import print_function
+import argparse
+import json
+import sys
+
+SCENARIOS = ('nodes', 'tasks', 'events', 'intervals', 'config', 'load_model', 'load_model_cached')
+
+def setup_nodes(app, count):
+    from panda3d.core import CardMaker
+    card = app.render.attach_new_node(CardMaker('card').generate())
+    root = app.render.attach_new_node('nodes')
+    side = max(1, int(count ** 0.5))
+    nodes = []
+    for i in range(count):
+        node = card.copy_to(root)
+        node.set_pos((i % side - side / 2.0) * 1.1, 50.0, (i // side - side / 2.0) * 1.1)
+        nodes.append(node)
+    card.remove_node()
+    moved = nodes[::max(1, count // 100)]
+
+    def move(task):
+        for node in moved:
+            node.set_r(task.time * 90.0)
+        return task.cont
+    app.add_task(move, 'benchmark_move')
+
+    def cleanup():
+        app.remove_task('benchmark_move')
+        root.remove_node()
+    return cleanup
+
+def setup_tasks(app, count):
+    def work(task):
+        return task.cont
+    #all under one name, so frame_stats sums them up
+    for i in range(count):
+        app.add_task(work, 'benchmark_task')
+
+    def cleanup():
+        app.remove_task('benchmark_task')
+    return cleanup
+
+def setup_events(app, count):
+    def on_event():
+        pass
+    events = ['benchmark_event_{0}'.format(i) for i in range(count)]
+    for event in events:
+        app.accept(event, on_event)
+
+    def send(task):
+        for event in events:
+            app.send(event)
+        return task.cont
+    app.add_task(send, 'benchmark_send')
+
+    def cleanup():
+        app.remove_task('benchmark_send')
+        for event in events:
+            app.ignore(event)
+    return cleanup
+
+def setup_intervals(app, count):
+    from direct.interval.IntervalGlobal import LerpPosInterval
+    root = app.render.attach_new_node('intervals')
+    intervals = []
+    for i in range(count):
+        interval = LerpPosInterval(root.attach_new_node('prop'), 1.0 + (i % 10) * 0.1,
+                                   (i, 10, 0), startPos=(i, 0, 0))
+        interval.loop()
+        intervals.append(interval)
+
+    def cleanup():
+        for interval in intervals:
+            interval.finish()
+        root.remove_node()
+    return cleanup
+
+def setup_config(app, count):
+    from simpleconfig import SimpleConfig as Config
+    keys = ('win-size', 'sync-video', 'fps-foreground', 'frame-stats', 'model-path')
+
+    def lookup(task):
+        for i in range(count):
+            Config[keys[i % len(keys)]]
+        return task.cont
+    app.add_task(lookup, 'benchmark_config')
+
+    def cleanup():
+        app.remove_task('benchmark_config')
+    return cleanup
+
+def _setup_load_model(app, count, cache_mb):
+    from assetcache import AssetCache
+    previous = app.asset_cache
+    app.asset_cache = AssetCache(app.loader, int(cache_mb * 1024 * 1024)) if cache_mb else None
+
+    def load(task):
+        for i in range(count):
+            app.load_model('frowney').remove_node()
+        return task.cont
+    app.add_task(load, 'benchmark_load_model')
+
+    def cleanup():
+        app.remove_task('benchmark_load_model')
+        if app.asset_cache is not None:
+            app.asset_cache.clear()
+        app.asset_cache = previous
+    return cleanup
+
+def setup_load_model(app, count):
+    return _setup_load_model(app, count, 0)
+
+def setup_load_model_cached(app, count):
+    return _setup_load_model(app, count, 64)
+
+def measure(app, frames, warm_up=5):
+    for i in range(warm_up):
+        app.task_mgr.step()
+    app.frame_stats.reset()
+    for i in range(frames):
+        app.task_mgr.step()
+    stats = app.frame_stats
+    return {'frame_ms': stats.get_percentiles(),
+            'tasks_ms': dict((name, stats.get_percentiles(name)) for name in stats.get_task_names())}
+
+def run(scenarios=SCENARIOS, counts=(100, 1000, 10000), frames=200):
+    from PandaApp import PandaApp
+    app = PandaApp()
+    setups = globals()
+    results = {'frames': frames, 'counts': list(counts), 'scenarios': {}}
+    results['baseline'] = measure(app, frames)
+    for scenario in scenarios:
+        results['scenarios'][scenario] = {}
+        for count in counts:
+            cleanup = setups['setup_' + scenario](app, count)
+            try:
+                results['scenarios'][scenario][str(count)] = measure(app, frames)
+            finally:
+                cleanup()
+    app.destroy()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.frameloop',
+                                     description='Headless benchmarks of the PandaApp frame loop')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help='Scenarios to run, all by default: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--counts', default='100,1000,10000',
+                        help='Comma separated counts to run each scenario with')
+    parser.add_argument('--frames', type=int, default=200,
+                        help='Frames measured per scenario and count')
+    parser.add_argument('--display', default='p3tinydisplay',
+                        help='Display module of the offscreen window')
+    parser.add_argument('--output', help='Write the json here instead of printing it')
+    args = parser.parse_args(argv)
+    for scenario in args.scenarios:
+        if scenario not in SCENARIOS:
+            parser.error('Unknown scenario {0!r}'.format(scenario))
+
+    from panda3d.core import load_prc_file_data
+    load_prc_file_data('', 'window-type offscreen\n'
+                           'load-display {0}\n'
+                           'audio-library-name null\n'
+                           'sync-video 0\n'
+                           'fps-background 0\n'
+                           'fps-minimized 0\n'
+                           'frame-stats 1\n'
+                           'frame-stats-frames {1}\n'
+                           'frame-stats-file \n'.format(args.display, args.frames))
+
+    results = run(args.scenarios or SCENARIOS, [int(i) for i in args.counts.split(',')], args.frames)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
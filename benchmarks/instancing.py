@@ -0,0 +1,64 @@
+"""Benchmark of load_model_instanced() against one load_model() per copy.
+
+Opens an offscreen buffer (needs a GPU, the software renderer has no
+shaders), places count copies of a model on a grid both ways and reports
+the node count, cull time and frame time as json.
+
+Run from the project root:
+python -m benchmarks.instancing [count] [model] [frames]
+"""
+from __future__ import print_function
+import json
+import sys
+
+from panda3d.core import load_prc_file_data
+load_prc_file_data('', 'window-type offscreen\n'
+                       'frame-stats 1\n'
+                       'frame-stats-file \n'
+                       'render-stage-timing 1\n'
+                       'sync-video 0\n')
+
+from PandaApp import PandaApp
+from instancing import pack_transforms
+
+def grid(count, spacing=3.0):
+    side = max(1, int(count ** 0.5))
+    return [((i % side - side / 2.0) * spacing, (i // side) * spacing, 0.0) for i in range(count)]
+
+def measure(app, root, frames):
+    """Renders frames and returns the stats"""
+    for i in range(5): #warm up
+        app.task_mgr.step()
+    app.frame_stats.reset()
+    app.render_stage_timer.reset()
+    for i in range(frames):
+        app.task_mgr.step()
+    return {'nodes': root.count_num_descendants() + 1,
+            'frame_ms': app.frame_stats.get_percentiles(),
+            'render_frame_ms': app.frame_stats.get_percentiles('render_frame_loop'),
+            'render_stages': app.get_render_stage_stats()}
+
+def run(count=10000, model='box', frames=200):
+    app = PandaApp()
+    positions = grid(count)
+    side = count ** 0.5 * 3.0
+    app.camera.set_pos(0, -side * 0.5, side * 0.75)
+    app.camera.look_at(0, side * 0.5, 0)
+    results = {'count': count, 'model': model}
+
+    root = app.render.attach_new_node('naive')
+    for pos in positions:
+        app.load_model(model, parent=root).set_pos(*pos)
+    results['naive'] = measure(app, root, frames)
+    root.remove_node()
+
+    group = app.load_model_instanced(model, pack_transforms(positions), parent=app.render)
+    results['instanced'] = measure(app, group.node_path, frames)
+    group.node_path.remove_node()
+    return results
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    model = sys.argv[2] if len(sys.argv) > 2 else 'box'
+    frames = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    print(json.dumps(run(count, model, frames), indent=2, sort_keys=True))
@@ -0,0 +1,105 @@
+"""Benchmark of generate_geom() against making the same chunks in-process.
+
+Makes count terrain chunks (a pure Python height field with normals, so
+it's GIL bound like most procedural code) once in the main process and
+then with generate_geom() on pools of different sizes, with no window.
+Reports chunks per second and, for the pool, the frame times while the
+chunks were being made, as json.
+
+Run from the project root:
+python -m benchmarks.procgen [count] [size] [processes]
+eg. python -m benchmarks.procgen 64 64 1,2,4
+"""
+from __future__ import print_function
+import json
+import math
+import os
+import sys
+from array import array
+
+from panda3d.core import load_prc_file_data
+load_prc_file_data('', 'window-type none\n'
+                       'frame-stats 1\n'
+                       'frame-stats-file \n')
+
+from framestats import clock
+
+def height(x, y):
+    return (math.sin(x * 0.11) * 4.0 + math.cos(y * 0.07) * 3.0 +
+            math.sin((x + y) * 0.031) * 8.0 + math.cos(x * 0.5 - y * 0.3))
+
+def make_chunk(cx, cy, size):
+    """Returns the 'v3n3' vertices and the triangle indices of a chunk"""
+    vertices = array('f')
+    for y in range(size + 1):
+        for x in range(size + 1):
+            wx, wy = cx * size + x, cy * size + y
+            z = height(wx, wy)
+            nx = height(wx - 1, wy) - height(wx + 1, wy)
+            ny = height(wx, wy - 1) - height(wx, wy + 1)
+            length = math.sqrt(nx * nx + ny * ny + 4.0)
+            vertices.extend((wx, wy, z, nx / length, ny / length, 2.0 / length))
+    indices = array('I')
+    row = size + 1
+    for y in range(size):
+        for x in range(size):
+            i = y * row + x
+            indices.extend((i, i + 1, i + row, i + 1, i + row + 1, i + row))
+    return vertices, indices
+
+def chunk_coords(count):
+    side = max(1, int(math.ceil(count ** 0.5)))
+    return [(i % side, i // side) for i in range(count)]
+
+def run_in_process(app, count, size):
+    from procgen import make_geom_node
+    root = app.render.attach_new_node('in_process')
+    start = clock()
+    for cx, cy in chunk_coords(count):
+        vertices, indices = make_chunk(cx, cy, size)
+        make_geom_node('chunk', 'v3n3', memoryview(vertices).cast('B'),
+                       memoryview(indices).cast('B')).reparent_to(root)
+    seconds = clock() - start
+    root.remove_node()
+    return {'seconds': seconds, 'chunks_per_second': count / seconds}
+
+def run_pool(app, count, size, processes):
+    from procgen import ProcGen
+    app.procgen.shutdown()
+    app.procgen = ProcGen(processes, 0)
+    app.restart()
+    #start the workers before timing
+    warm_up = app.generate_geom(make_chunk, 0, 0, 2)
+    while not warm_up.done():
+        app.task_mgr.step()
+    root = app.render.attach_new_node('pool')
+    app.frame_stats.reset()
+    start = clock()
+    handles = [app.generate_geom(make_chunk, cx, cy, size, parent=root)
+               for cx, cy in chunk_coords(count)]
+    while not all(handle.done() for handle in handles):
+        app.task_mgr.step()
+    seconds = clock() - start
+    for handle in handles:
+        handle.result()
+    root.remove_node()
+    return {'seconds': seconds, 'chunks_per_second': count / seconds,
+            'frame_ms': app.frame_stats.get_percentiles()}
+
+def run(count=64, size=64, process_counts=None):
+    from PandaApp import PandaApp
+    app = PandaApp()
+    if not process_counts:
+        process_counts = sorted(set([1, 2, 4, os.cpu_count() or 1]))
+    results = {'count': count, 'size': size, 'cpus': os.cpu_count(),
+               'in_process': run_in_process(app, count, size)}
+    for processes in process_counts:
+        results['pool_{0}'.format(processes)] = run_pool(app, count, size, processes)
+    app.procgen.shutdown()
+    return results
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    process_counts = [int(i) for i in sys.argv[3].split(',')] if len(sys.argv) > 3 else None
+    print(json.dumps(run(count, size, process_counts), indent=2, sort_keys=True))
@@ -0,0 +1,68 @@
+"""Fixed timestep scheduler for PandaApp.
+
+Functions added with PandaApp.add_fixed_task() are called with a fixed
+dt, 'fixed-step-rate' times per second of game time, no matter how fast
+the frames are rendered. Each frame the 'fixed_step' task runs as many
+steps as the elapsed time calls for, but at most 'fixed-step-max-steps'
+(the rest of the time is dropped, so a slow frame can't snowball into
+ever slower frames). What's left over is exposed as alpha (0.0-1.0),
+use it to interpolate between the last two simulation states when rendering.
+"""
+from direct.task import Task
+
+__all__ = ['FixedStep']
+
+class FixedStep(object):
+    def __init__(self, rate=60, max_steps=5):
+        self.set_rate(rate)
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.alpha = 0.0
+        self.step_count = 0
+        self.time = 0.0
+        self.dropped_time = 0.0
+        self.steps_last_frame = 0
+        self._callbacks = []
+
+    def set_rate(self, rate):
+        self.rate = rate
+        self.dt = 1.0 / rate
+
+    def add(self, func, name, sort=0, extraArgs=[]):
+        """func(*extraArgs, dt) is called every step, lower sort goes first.
+        If func returns Task.done it's removed."""
+        self._callbacks.append((sort, name, func, list(extraArgs)))
+        self._callbacks.sort(key=lambda callback: callback[0])
+
+    def remove(self, name):
+        self._callbacks = [callback for callback in self._callbacks if callback[1] != name]
+
+    def has(self, name):
+        return any(callback[1] == name for callback in self._callbacks)
+
+    def update(self, frame_dt):
+        """Runs the steps for frame_dt seconds of game time"""
+        self.accumulator += frame_dt
+        steps = int(self.accumulator / self.dt)
+        if steps > self.max_steps:
+            self.dropped_time += (steps - self.max_steps) * self.dt
+            self.accumulator -= (steps - self.max_steps) * self.dt
+            steps = self.max_steps
+        for i in range(steps):
+            self.step()
+            self.accumulator -= self.dt
+        self.steps_last_frame = steps
+        self.alpha = min(1.0, max(0.0, self.accumulator / self.dt))
+
+    def step(self):
+        """Runs a single step"""
+        done = []
+        for callback in self._callbacks:
+            sort, name, func, extraArgs = callback
+            if func(*(extraArgs + [self.dt])) == Task.done:
+                done.append(callback)
+        for callback in done:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+        self.step_count += 1
+        self.time += self.dt
@@ -0,0 +1,177 @@
+"""Frame capture for PandaApp.start_capture(), for recording and thumbnails.
+
+A texture is added to the window (or any buffer) with RTM_copy_ram, so
+Panda copies each rendered frame into its ram image. The ram image is one
+of a ring of 'num_buffers' buffers made up front: once a frame is in, the
+'frame_capture' task (right after render_frame_loop) hands that buffer to
+the writer thread and gives the texture a free one for the next frame,
+the pixels are never copied again on the main thread. If the writer is
+behind and no buffer is free the frame is dropped, rendering never waits
+for it (frame_stats counts 'frames_captured' and 'frames_dropped').
+
+The writer is called on its own thread as writer(number, image, x_size,
+y_size, num_components), image is the raw ram image (buffer protocol,
+unsigned bytes in Panda's order: BGR(A), bottom row first), don't keep it
+after returning, the buffer goes back to the ring. ImageWriter saves the
+frames as image files, RawWriter appends them to one file (or pipe),
+eg. for ffmpeg -f rawvideo -pix_fmt bgra -s 800x600 -vf vflip.
+
+Works with any display, p3tinydisplay included (with window-type
+offscreen it needs no gpu at all).
+"""
+import threading
+from collections import deque
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from direct.task import Task
+from panda3d.core import Texture, GraphicsOutput, PTA_uchar
+
+__all__ = ['FrameCapture', 'ImageWriter', 'RawWriter']
+
+class ImageWriter(object):
+    """Saves each frame to pattern.format(number), eg. 'shots/frame_{0:05d}.png'"""
+    def __init__(self, pattern):
+        self.pattern = pattern
+
+    def __call__(self, number, image, x_size, y_size, num_components):
+        tex = Texture('captured_frame')
+        tex.setup_2d_texture(x_size, y_size, Texture.T_unsigned_byte,
+                             Texture.F_rgba if num_components == 4 else Texture.F_rgb)
+        tex.set_ram_image(image)
+        tex.write(self.pattern.format(number))
+
+class RawWriter(object):
+    """Writes the raw frames one after another to a file, or a file object (eg. a pipe)"""
+    def __init__(self, file):
+        self.file = open(file, 'wb') if isinstance(file, str) else file
+
+    def __call__(self, number, image, x_size, y_size, num_components):
+        self.file.write(memoryview(image))
+
+    def close(self):
+        self.file.close()
+
+class FrameCapture(object):
+    def __init__(self, output, writer, num_buffers=4, every=1, max_frames=0, frame_stats=None):
+        self.output = output
+        self.writer = writer
+        self.num_buffers = max(2, num_buffers)
+        self.every = max(1, every)
+        self.max_frames = max_frames
+        self.frame_stats = frame_stats
+        self.frames_rendered = 0
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.frames_written = 0
+        self.errors = 0
+        self.last_error = None
+        self.tex = Texture('frame_capture')
+        self.buffer_size = 0
+        #free buffers, returned by the writer thread
+        self._free = deque()
+        self._queue = queue.Queue()
+        self._last_modified = self.tex.get_image_modified()
+        output.add_render_texture(self.tex, GraphicsOutput.RTM_copy_ram)
+        self._thread = threading.Thread(target=self._write_frames, name='frame_capture')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def is_capturing(self):
+        return self.tex is not None
+
+    def update(self, task=None):
+        """Hands the frame just rendered to the writer, runs after render_frame_loop"""
+        tex = self.tex
+        if tex is None:
+            return Task.done
+        modified = tex.get_image_modified()
+        if modified == self._last_modified or not tex.has_ram_image():
+            return Task.cont
+        self.frames_rendered += 1
+        if (self.frames_rendered - 1) % self.every:
+            #the next frame goes into the same buffer
+            self._last_modified = modified
+            return Task.cont
+        size = tex.get_ram_image_size()
+        if size != self.buffer_size:
+            #first frame or the window was resized, the old buffers get dropped when they come back
+            self.buffer_size = size
+            self._free.clear()
+            for i in range(self.num_buffers - 1):
+                self._free.append(PTA_uchar.empty_array(size))
+        buffer = None
+        while self._free:
+            buffer = self._free.popleft()
+            if len(buffer) == size:
+                break
+            buffer = None
+        if buffer is None:
+            self.frames_dropped += 1
+            self._last_modified = modified
+            if self.frame_stats:
+                self.frame_stats.count('frames_dropped')
+            return Task.cont
+        image = tex.get_ram_image()
+        tex.set_ram_image(buffer)
+        self._last_modified = tex.get_image_modified()
+        self.frames_captured += 1
+        if self.frame_stats:
+            self.frame_stats.count('frames_captured')
+        self._queue.put((self.frames_captured - 1, image, tex.get_x_size(), tex.get_y_size(),
+                         tex.get_num_components()))
+        if self.max_frames and self.frames_captured >= self.max_frames:
+            self.stop(wait=False)
+            return Task.done
+        return Task.cont
+
+    def _write_frames(self):
+        """The writer thread"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            number, image, x_size, y_size, num_components = item
+            try:
+                self.writer(number, image, x_size, y_size, num_components)
+                self.frames_written += 1
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+            if len(image) == self.buffer_size:
+                self._free.append(image)
+        if hasattr(self.writer, 'close'):
+            self.writer.close()
+
+    def stop(self, wait=True):
+        """Stops capturing, the frames already captured still get written
+        (and the writer closed, if it has a close()), with wait, this
+        returns once they are"""
+        if self.tex is not None:
+            self._remove_render_texture()
+            self.tex = None
+            self._queue.put(None)
+        if wait and self._thread.is_alive():
+            self._thread.join()
+
+    def _remove_render_texture(self):
+        #there's no way to remove just one, so put back the others
+        output = self.output
+        others = [(output.get_texture(i), output.get_rtm_mode(i))
+                  for i in range(output.count_textures()) if output.get_texture(i) != self.tex]
+        output.clear_render_textures()
+        for tex, mode in others:
+            output.add_render_texture(tex, mode)
+
+    def get_stats(self):
+        return {'rendered': self.frames_rendered,
+                'captured': self.frames_captured,
+                'dropped': self.frames_dropped,
+                'written': self.frames_written,
+                'pending': self._queue.qsize(),
+                'errors': self.errors,
+                'buffers': self.num_buffers,
+                'buffer_bytes': self.buffer_size}
@@ -0,0 +1,108 @@
+"""Frame rate limiter for PandaApp.
+
+There's a target frame rate for when the window is in the foreground,
+in the background (not focused) and minimized, a target of 0 means
+'as fast as it goes'. PandaApp switches between them on the
+window-event-focus/-focus-lost/-minimize/-restore events and calls
+wait() in its 'frame_pacer' task, the last one of each frame (so the
+frame stats show the wait as frame_pacer, not as render_frame_loop).
+
+To hit the target without jitter wait() sleeps until 'spin' seconds
+before the deadline and busy-waits the rest, the deadlines are spaced
+exactly one frame apart so the average stays on target even if a single
+frame runs late.
+"""
+from __future__ import division
+import time
+
+from framestats import clock
+
+__all__ = ['FramePacer']
+
+class FramePacer(object):
+    FOREGROUND, BACKGROUND, MINIMIZED = 'foreground', 'background', 'minimized'
+
+    def __init__(self, foreground=0, background=30, minimized=10, spin=0.002, history=120):
+        self.target_fps = {FramePacer.FOREGROUND: foreground,
+                           FramePacer.BACKGROUND: background,
+                           FramePacer.MINIMIZED: minimized}
+        self.mode = FramePacer.FOREGROUND
+        self.spin = spin
+        self.history = max(1, history)
+        self.frame_times = []
+        self.wait_times = []
+        self._index = 0
+        self._deadline = None
+        self._last_frame = None
+
+    def set_mode(self, mode):
+        """Switch to the 'foreground', 'background' or 'minimized' target"""
+        if mode != self.mode:
+            self.mode = mode
+            self._deadline = None
+
+    def set_target_fps(self, mode, fps):
+        self.target_fps[mode] = fps
+        self._deadline = None
+
+    def get_target_fps(self):
+        """Returns the frame rate for the current mode (0 if not limited)"""
+        return self.target_fps[self.mode]
+
+    def get_time_left(self, budget=0):
+        """Returns the seconds left until the next frame should start, with
+        no frame rate limit the frame gets budget seconds (0 means no time left)"""
+        now = clock()
+        fps = self.target_fps[self.mode]
+        if fps > 0:
+            frame_time = 1.0 / fps
+            if self._deadline is None or now - self._deadline > frame_time:
+                return frame_time
+            return self._deadline + frame_time - now
+        if budget > 0 and self._last_frame is not None:
+            return max(0.0, self._last_frame + budget - now)
+        return 0.0
+
+    def wait(self):
+        """Waits until it's time to start the next frame"""
+        start = clock()
+        fps = self.target_fps[self.mode]
+        if fps > 0:
+            frame_time = 1.0 / fps
+            if self._deadline is None or start - self._deadline > frame_time:
+                #first frame, or we fell more than a frame behind, don't try to catch up
+                self._deadline = start
+            self._deadline += frame_time
+            remaining = self._deadline - start - self.spin
+            if remaining > 0:
+                time.sleep(remaining)
+            while clock() < self._deadline:
+                pass
+        end = clock()
+        if self._last_frame is not None:
+            self._record(end - self._last_frame, end - start)
+        self._last_frame = end
+
+    def _record(self, frame_time, wait_time):
+        if len(self.frame_times) < self.history:
+            self.frame_times.append(frame_time)
+            self.wait_times.append(wait_time)
+        else:
+            self.frame_times[self._index] = frame_time
+            self.wait_times[self._index] = wait_time
+            self._index = (self._index + 1) % self.history
+
+    def get_stats(self):
+        """Returns the target and achieved frame time (ms) and rate
+        over the last 'history' frames, and how much of it was spent waiting"""
+        fps = self.target_fps[self.mode]
+        stats = {'mode': self.mode,
+                 'target_fps': fps,
+                 'target_ms': 1000.0 / fps if fps > 0 else 0.0}
+        if self.frame_times:
+            mean = sum(self.frame_times) / len(self.frame_times)
+            stats['achieved_ms'] = mean * 1000.0
+            stats['achieved_fps'] = 1.0 / mean if mean > 0 else 0.0
+            stats['worst_ms'] = max(self.frame_times) * 1000.0
+            stats['wait_ms'] = sum(self.wait_times) * 1000.0 / len(self.wait_times)
+        return stats
@@ -0,0 +1,168 @@
+"""Opt-in per-frame task timing for PandaApp.
+
+Turn it on with 'frame-stats 1' in your prc file. PandaApp will then
+wrap its core tasks and every task added with add_task()/do_method_later()
+and record how long each one took, frame by frame, in a ring buffer of
+'frame-stats-frames' frames. With frame-stats off nothing gets wrapped,
+so the only cost is one 'is None' check when a task is added.
+"""
+from __future__ import division
+import json
+import time
+from functools import wraps
+
+__all__ = ['FrameStats', 'PhaseTimer']
+
+clock = getattr(time, 'perf_counter', time.time)
+
+class FrameStats(object):
+    """Ring buffer of per-frame task timings (in seconds).
+
+    Each recorded frame is a (frame_number, frame_time, {task_name: time},
+    {counter_name: count}) tuple, the frame time is measured from one
+    begin_frame() call to the next. Reports (get_percentiles(),
+    get_worst_frame(), get_report()) use milliseconds.
+    """
+    def __init__(self, size=600):
+        self.size = max(1, size)
+        self.frames = [None] * self.size
+        self.num_frames = 0
+        self.current = {}
+        self.counts = {}
+        self.frame_start = None
+
+    def begin_frame(self):
+        """Closes the current frame (if any) and starts a new one"""
+        now = clock()
+        if self.frame_start is not None:
+            self.frames[self.num_frames % self.size] = (self.num_frames,
+                                                        now - self.frame_start,
+                                                        self.current,
+                                                        self.counts)
+            self.num_frames += 1
+        self.current = {}
+        self.counts = {}
+        self.frame_start = now
+
+    def add(self, name, seconds):
+        """Adds time spent on 'name' to the current frame"""
+        self.current[name] = self.current.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        """Adds n to the counter 'name' of the current frame (things that
+        aren't times, like the number of objects collected)"""
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def wrap(self, func, name):
+        """Returns func wrapped so that each call is added to the current frame as 'name'"""
+        add = self.add
+        @wraps(func)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                add(name, clock() - start)
+        return timed
+
+    def reset(self):
+        """Forgets all recorded frames"""
+        self.frames = [None] * self.size
+        self.num_frames = 0
+        self.current = {}
+        self.counts = {}
+        self.frame_start = None
+
+    def get_frames(self):
+        """Returns the recorded frames, oldest first"""
+        if self.num_frames < self.size:
+            return self.frames[:self.num_frames]
+        i = self.num_frames % self.size
+        return self.frames[i:] + self.frames[:i]
+
+    def get_task_names(self):
+        """Returns the names of all tasks seen in the recorded frames"""
+        names = set()
+        for frame in self.get_frames():
+            names.update(frame[2])
+        return sorted(names)
+
+    def get_percentiles(self, name=None, percentiles=(50, 95, 99)):
+        """Returns {'p50': ms, ...} for the named task (counting only frames
+        where it ran) or for the whole frame if name is None"""
+        if name is None:
+            samples = [frame[1] for frame in self.get_frames()]
+        else:
+            samples = [frame[2][name] for frame in self.get_frames() if name in frame[2]]
+        return _percentiles(samples, percentiles)
+
+    def get_worst_frame(self):
+        """Returns the breakdown of the slowest recorded frame, or None"""
+        frames = self.get_frames()
+        if not frames:
+            return None
+        number, total, times, counts = max(frames, key=lambda frame: frame[1])
+        return {'frame': number,
+                'frame_ms': total * 1000.0,
+                'tasks_ms': dict((name, t * 1000.0) for name, t in times.items()),
+                'counts': dict(counts)}
+
+    def get_counts(self):
+        """Returns {counter_name: {'total', 'max', 'frames'}} over the recorded
+        frames, frames is the number of frames the counter was touched in"""
+        counts = {}
+        for frame in self.get_frames():
+            for name, n in frame[3].items():
+                count = counts.setdefault(name, {'total': 0, 'max': 0, 'frames': 0})
+                count['total'] += n
+                count['max'] = max(count['max'], n)
+                count['frames'] += 1
+        return counts
+
+    def get_report(self):
+        """Returns all the stats as a dict, ready to be dumped to json"""
+        return {'frames': min(self.num_frames, self.size),
+                'frame_ms': self.get_percentiles(),
+                'tasks_ms': dict((name, self.get_percentiles(name))
+                                 for name in self.get_task_names()),
+                'counts': self.get_counts(),
+                'worst_frame': self.get_worst_frame()}
+
+    def dump(self, path):
+        """Writes get_report() to a json file"""
+        with open(path, 'w') as f:
+            json.dump(self.get_report(), f, indent=2, sort_keys=True)
+
+def _percentiles(samples, percentiles):
+    """Nearest-rank percentiles of samples (in seconds) as milliseconds"""
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    last = len(samples) - 1
+    result = {'mean': sum(samples) * 1000.0 / len(samples),
+              'max': samples[-1] * 1000.0}
+    for p in percentiles:
+        result['p{0}'.format(p)] = samples[min(last, int(round(p / 100 * last)))] * 1000.0
+    return result
+
+class PhaseTimer(object):
+    """Times a sequence of phases (like the steps of the startup),
+    mark(name) ends the phase called name and starts the next one"""
+    def __init__(self):
+        self.phases = []
+        self.last = clock()
+
+    def mark(self, name):
+        now = clock()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def get_report(self):
+        """Returns a list of (phase name, ms)"""
+        return [(name, seconds * 1000.0) for name, seconds in self.phases]
+
+    def format_report(self):
+        report = self.get_report()
+        lines = ['{0:<24}{1:>10.2f} ms'.format(name, ms) for name, ms in report]
+        lines.append('{0:<24}{1:>10.2f} ms'.format('total', sum(ms for name, ms in report)))
+        return '\n'.join(lines)
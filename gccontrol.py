@@ -0,0 +1,133 @@
+"""Frame budget aware control of Python's garbage collector for PandaApp.
+
+Python's cyclic gc runs whenever its counters say so, a full (generation 2)
+collection with lots of live objects can take tens of ms and it lands in
+the middle of whatever task happened to allocate. With
+'python-gc-control 1' PandaApp turns off the automatic generation 2
+collections (the young generations still run on their own, they are
+cheap) and runs them itself after the frame is rendered, but only if
+the last full collections took less than the time left in the frame
+(until the frame pacer's next frame, or 'python-gc-frame-budget' ms
+with no frame rate limit). If there's never enough time it collects
+anyway after 'python-gc-max-interval' seconds, so garbage can't pile up.
+
+Before the first frame everything alive (the startup objects, the loaded
+level, etc) is moved to a permanent generation with gc.freeze() (Python
+3.7+), so full collections don't have to walk it.
+Every collection is timed and added to the frame_stats, as 'python_gc'
+(or 'python_gc_idle' for the ones run after rendering), see also get_stats().
+"""
+from __future__ import division
+import gc
+
+from framestats import clock
+
+__all__ = ['GCControl']
+
+#the biggest value gc.set_threshold() takes
+_NEVER = 2 ** 31 - 1
+
+class GCControl(object):
+    def __init__(self, frame_budget=1.0 / 60.0, max_interval=10.0, frame_stats=None, history=120):
+        self.frame_budget = frame_budget
+        self.max_interval = max_interval
+        self.frame_stats = frame_stats
+        self.history = max(1, history)
+        self.enabled = False
+        self.frozen = False
+        self.old_threshold = gc.get_threshold()
+        self.full_after = max(1, self.old_threshold[2])
+        self.pauses = []
+        self.full_times = []
+        self.num_full = 0
+        self.num_forced = 0
+        self.num_skipped = 0
+        self.last_full = clock()
+        self._start = None
+        self._idle = False
+
+    def enable(self):
+        """Stops the automatic full collections and starts timing the gc"""
+        if self.enabled:
+            return
+        self.enabled = True
+        self.old_threshold = gc.get_threshold()
+        gc.set_threshold(self.old_threshold[0], self.old_threshold[1], _NEVER)
+        gc.callbacks.append(self._on_gc)
+
+    def disable(self):
+        """Gives the gc back its own thresholds"""
+        if not self.enabled:
+            return
+        self.enabled = False
+        gc.set_threshold(*self.old_threshold)
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+
+    def freeze(self):
+        """Moves all objects alive now out of the reach of the gc"""
+        if hasattr(gc, 'freeze'):
+            #runs at load time (the first idle() call), not in a frame
+            self._idle = True
+            try:
+                gc.collect()
+            finally:
+                self._idle = False
+            gc.freeze()
+        self.frozen = True
+        self.last_full = clock()
+
+    def idle(self, time_left):
+        """Runs a full collection if one is due and fits into time_left seconds,
+        call once per frame when the frame's work is done"""
+        if not self.frozen:
+            self.freeze()
+            return False
+        if gc.get_count()[2] < self.full_after:
+            return False
+        forced = clock() - self.last_full > self.max_interval
+        if not forced and self.full_times and max(self.full_times) > time_left:
+            self.num_skipped += 1
+            return False
+        self._idle = True
+        start = clock()
+        try:
+            gc.collect(2)
+        finally:
+            self._idle = False
+        self.last_full = clock()
+        self._add(self.full_times, self.last_full - start)
+        self.num_full += 1
+        if forced:
+            self.num_forced += 1
+        return True
+
+    def _add(self, samples, value):
+        if len(samples) >= self.history:
+            del samples[0]
+        samples.append(value)
+
+    def _on_gc(self, phase, info):
+        if phase == 'start':
+            self._start = clock()
+        elif self._start is not None:
+            pause = clock() - self._start
+            self._start = None
+            self._add(self.pauses, pause)
+            if self.frame_stats:
+                #a full collection in idle time is not a hitch, keep them apart
+                self.frame_stats.add('python_gc_idle' if self._idle else 'python_gc', pause)
+                self.frame_stats.count('python_gc_collected', info.get('collected', 0))
+
+    def get_stats(self):
+        """Returns pause times (ms) of the last 'history' collections and counts"""
+        stats = {'full_collections': self.num_full,
+                 'forced': self.num_forced,
+                 'skipped': self.num_skipped,
+                 'frozen': gc.get_freeze_count() if hasattr(gc, 'get_freeze_count') else 0}
+        if self.pauses:
+            stats['pause_mean_ms'] = sum(self.pauses) * 1000.0 / len(self.pauses)
+            stats['pause_max_ms'] = max(self.pauses) * 1000.0
+        if self.full_times:
+            stats['full_max_ms'] = max(self.full_times) * 1000.0
+        return stats
@@ -0,0 +1,131 @@
+"""Frame-coherent input snapshot for PandaApp.
+
+With 'input-state 1' PandaApp fills self.input_state in data_loop, once
+per frame, so tasks can read the keyboard and mouse with plain indexing
+instead of calling is_button_down() or get_mouse() all over the place.
+To have this frame's button events in the snapshot, PandaApp dispatches
+the queued events right after the data graph traversal (so with
+input-state on, accept() callbacks run in data_loop, before other tasks).
+
+buttons[device][button_index] holds the DOWN, PRESSED and RELEASED bits,
+PRESSED and RELEASED are set only for the frame the change happened in
+(both can be set if the key was tapped between two frames).
+get_index('a') gives the button_index of a button name (cached), the
+arrays grow when a button with a higher index is first used.
+mouse[pointer] is an array of [x, y, dx, dy, has_mouse] for each of the
+pointer_watcher_nodes, wheel[device] counts wheel_up (+1) and wheel_down
+(-1) clicks this frame.
+"""
+from array import array
+
+from panda3d.core import ButtonRegistry
+
+__all__ = ['InputState']
+
+_MODIFIERS = ('shift', 'control', 'alt', 'meta')
+
+class InputState(object):
+    DOWN, PRESSED, RELEASED = 1, 2, 4
+    X, Y, DX, DY, HAS_MOUSE = range(5)
+
+    def __init__(self, messenger, button_throwers, pointer_watcher_nodes):
+        self.messenger = messenger
+        self.pointer_watcher_nodes = pointer_watcher_nodes
+        self.frame = 0
+        self.buttons = [bytearray(256) for bt in button_throwers]
+        self.mouse = [array('d', [0.0] * 5) for mw in pointer_watcher_nodes]
+        self.wheel = array('i', [0] * len(button_throwers))
+        self._indices = {}
+        self._changed = []
+        self._events = []
+        for i, bt in enumerate(button_throwers):
+            node = bt.node()
+            down_event = 'input-state-down-{0}'.format(i)
+            up_event = 'input-state-up-{0}'.format(i)
+            node.set_button_down_event(down_event)
+            node.set_button_up_event(up_event)
+            #the generic events get the prefix of the ButtonThrower too
+            for event, method in ((down_event, self._on_down), (up_event, self._on_up)):
+                event = node.get_prefix() + event
+                self.messenger.accept(event, self, method, [i], 1)
+                self._events.append(event)
+
+    def destroy(self):
+        for event in self._events:
+            self.messenger.ignore(event, self)
+        self._events = []
+
+    def get_index(self, name):
+        """Returns the index of the named button in the buttons arrays"""
+        index = self._indices.get(name)
+        if index is None:
+            index = self._indices[name] = ButtonRegistry.ptr().find_button(name).get_index()
+        return index
+
+    def get(self, name, device=0):
+        """Returns the bits of the named button"""
+        buttons = self.buttons[device]
+        index = self.get_index(name)
+        return buttons[index] if index < len(buttons) else 0
+
+    def is_down(self, name, device=0):
+        return bool(self.get(name, device) & InputState.DOWN)
+
+    def was_pressed(self, name, device=0):
+        """True if the button went down this frame"""
+        return bool(self.get(name, device) & InputState.PRESSED)
+
+    def was_released(self, name, device=0):
+        """True if the button went up this frame"""
+        return bool(self.get(name, device) & InputState.RELEASED)
+
+    def begin_frame(self):
+        """Clears the per-frame bits, call before the data graph traversal"""
+        for device, index in self._changed:
+            self.buttons[device][index] &= InputState.DOWN
+        self._changed = []
+        for i in range(len(self.wheel)):
+            self.wheel[i] = 0
+        self.frame += 1
+
+    def update_pointers(self):
+        """Reads the pointer positions, call after the data graph traversal"""
+        for mouse, mw in zip(self.mouse, self.pointer_watcher_nodes):
+            if mw.has_mouse():
+                x = mw.get_mouse_x()
+                y = mw.get_mouse_y()
+                if mouse[InputState.HAS_MOUSE]:
+                    mouse[InputState.DX] = x - mouse[InputState.X]
+                    mouse[InputState.DY] = y - mouse[InputState.Y]
+                else:
+                    mouse[InputState.DX] = mouse[InputState.DY] = 0.0
+                mouse[InputState.X] = x
+                mouse[InputState.Y] = y
+                mouse[InputState.HAS_MOUSE] = 1.0
+            else:
+                mouse[InputState.DX] = mouse[InputState.DY] = 0.0
+                mouse[InputState.HAS_MOUSE] = 0.0
+
+    def _set(self, device, name, down):
+        #the generic events may have the modifiers in the name (eg. 'shift-a')
+        while name.partition('-')[0] in _MODIFIERS and len(name) > len(name.partition('-')[0]) + 1:
+            name = name.partition('-')[2]
+        index = self.get_index(name)
+        buttons = self.buttons[device]
+        if index >= len(buttons):
+            buttons.extend(bytearray(index + 1 - len(buttons)))
+        if down:
+            buttons[index] |= InputState.DOWN | InputState.PRESSED
+        else:
+            buttons[index] = (buttons[index] & ~InputState.DOWN) | InputState.RELEASED
+        self._changed.append((device, index))
+
+    def _on_down(self, device, name, *args):
+        self._set(device, name, True)
+        if name.endswith('wheel_up'):
+            self.wheel[device] += 1
+        elif name.endswith('wheel_down'):
+            self.wheel[device] -= 1
+
+    def _on_up(self, device, name, *args):
+        self._set(device, name, False)
@@ -0,0 +1,235 @@
+"""Hardware instancing for PandaApp.load_model_instanced().
+
+The model is flattened into as few Geoms as possible and drawn
+count times in one draw call (per Geom), the per-instance transforms are
+4x4 matrices packed in a float buffer texture that the vertex shader
+reads with gl_InstanceID. Panda culls the whole group as one node, its
+bounds are computed from the instance positions (and model size) when
+the transforms are set.
+
+Transforms can be given as anything with the buffer protocol holding
+float32 data, 16 floats per instance, row-major like Panda's own
+matrices (eg. a numpy array of shape (n, 4, 4) or (n, 16), or an
+array('f')), or as a sequence of Mat4, TransformState, NodePath or
+(x, y, z) positions, pack_transforms() does the packing.
+
+The built-in shader does what the fixed function pipeline would: the
+texture, vertex color, color scale and material, lit per pixel by up to
+MAX_LIGHTS of the scene's lights (no specular, no normal maps, shadows
+or fog). For anything else give your own shader, it has to read the
+instance matrices like _VERTEX_SHADER does, from the 'instances' buffer
+texture with gl_InstanceID.
+"""
+from array import array
+
+from panda3d.core import (Shader, Texture, GeomEnums, BoundingBox, Point3,
+                          Mat4, NodePath, TransformState)
+
+__all__ = ['InstanceGroup', 'pack_transforms']
+
+FLOATS_PER_INSTANCE = 16
+#lights the built-in shader takes from the scene
+MAX_LIGHTS = 8
+
+_VERTEX_SHADER = """#version 140
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform mat4 p3d_ModelViewMatrix;
+uniform samplerBuffer instances;
+in vec4 p3d_Vertex;
+in vec3 p3d_Normal;
+in vec4 p3d_Color;
+in vec2 p3d_MultiTexCoord0;
+out vec2 uv;
+out vec3 view_pos;
+out vec3 view_normal;
+out vec4 vertex_color;
+void main() {
+    int i = gl_InstanceID * 4;
+    mat4 m = mat4(texelFetch(instances, i), texelFetch(instances, i + 1),
+                  texelFetch(instances, i + 2), texelFetch(instances, i + 3));
+    vec4 pos = m * p3d_Vertex;
+    gl_Position = p3d_ModelViewProjectionMatrix * pos;
+    view_pos = vec3(p3d_ModelViewMatrix * pos);
+    view_normal = mat3(p3d_ModelViewMatrix) * (mat3(m) * p3d_Normal);
+    uv = p3d_MultiTexCoord0;
+    vertex_color = p3d_Color;
+}
+"""
+
+#per pixel version of the fixed function lighting (no specular), with no
+#lights in the scene Panda gives an all white ambient, so it's unlit then
+_FRAGMENT_SHADER = """#version 140
+#define MAX_LIGHTS %d
+uniform sampler2D p3d_Texture0;
+uniform vec4 p3d_ColorScale;
+uniform struct {
+    vec4 ambient;
+} p3d_LightModel;
+uniform struct {
+    vec4 ambient;
+    vec4 diffuse;
+    vec4 emission;
+} p3d_Material;
+uniform struct {
+    vec4 color;
+    vec4 position;
+    vec3 spotDirection;
+    float spotCosCutoff;
+    float spotExponent;
+    vec3 attenuation;
+} p3d_LightSource[MAX_LIGHTS];
+in vec2 uv;
+in vec3 view_pos;
+in vec3 view_normal;
+in vec4 vertex_color;
+out vec4 color;
+void main() {
+    vec3 normal = normalize(view_normal);
+    vec3 diffuse = vec3(0.0);
+    for (int i = 0; i < MAX_LIGHTS; ++i) {
+        vec4 position = p3d_LightSource[i].position;
+        vec3 to_light = position.xyz - view_pos * position.w;
+        float dist = length(to_light);
+        to_light /= max(dist, 0.0001);
+        float light = max(dot(normal, to_light), 0.0);
+        light /= dot(p3d_LightSource[i].attenuation, vec3(1.0, dist, dist * dist));
+        float spot = dot(-to_light, p3d_LightSource[i].spotDirection);
+        if (p3d_LightSource[i].spotCosCutoff > -1.0) {
+            light *= spot < p3d_LightSource[i].spotCosCutoff ? 0.0 : pow(spot, p3d_LightSource[i].spotExponent);
+        }
+        diffuse += p3d_LightSource[i].color.rgb * light;
+    }
+    vec3 lit = p3d_LightModel.ambient.rgb * p3d_Material.ambient.rgb +
+               diffuse * p3d_Material.diffuse.rgb + p3d_Material.emission.rgb;
+    color = texture(p3d_Texture0, uv) * vertex_color;
+    color.rgb *= lit;
+    color *= p3d_ColorScale;
+}
+""" % MAX_LIGHTS
+
+_shader = None
+
+def get_instancing_shader():
+    """Returns the (shared) shader used for the instanced models"""
+    global _shader
+    if _shader is None:
+        _shader = Shader.make(Shader.SL_GLSL, _VERTEX_SHADER, _FRAGMENT_SHADER)
+    return _shader
+
+def pack_transforms(transforms):
+    """Packs a sequence of Mat4, TransformState, NodePath or (x, y, z)
+    into an array('f') of 16 floats per instance"""
+    data = array('f')
+    for item in transforms:
+        if isinstance(item, NodePath):
+            item = item.get_mat()
+        elif isinstance(item, TransformState):
+            item = item.get_mat()
+        elif len(item) == 3:
+            item = Mat4.translate_mat(*item)
+        for row in range(4):
+            data.extend(item.get_row(row))
+    return data
+
+class InstanceGroup(object):
+    """A model drawn count times with hardware instancing,
+    node_path is the one node that holds them all"""
+    def __init__(self, model, transforms, parent=None, shader=None):
+        self.node_path = model
+        self.node_path.flatten_strong()
+        self.radius = 0.0
+        bounds = self.node_path.get_bounds()
+        if not bounds.is_empty():
+            self.radius = bounds.get_center().length() + bounds.get_radius()
+        self.count = 0
+        self.capacity = 0
+        self.texture = Texture('instances')
+        self.node_path.set_shader(shader or get_instancing_shader())
+        self.node_path.set_shader_input('instances', self.texture)
+        if parent is not None:
+            self.node_path.reparent_to(parent)
+        self.set_transforms(transforms)
+
+    def set_transforms(self, transforms, start=0):
+        """Sets the transforms of the instances from start on, the group
+        grows if needed (but never shrinks, use set_count() for that)"""
+        data = _as_float_view(transforms)
+        count = len(data) // FLOATS_PER_INSTANCE
+        if start + count > self.capacity:
+            self._resize(start + count)
+        image = memoryview(self.texture.modify_ram_image()).cast('B').cast('f')
+        offset = start * FLOATS_PER_INSTANCE
+        size = count * FLOATS_PER_INSTANCE
+        image[offset:offset + size] = data[:size]
+        self.set_count(max(self.count, start + count))
+
+    def set_count(self, count):
+        """Sets how many of the instances are drawn"""
+        self.count = min(count, self.capacity)
+        self.node_path.set_instance_count(self.count)
+        self.update_bounds()
+
+    def update_bounds(self):
+        """Recomputes the bounds of the group from the instance transforms"""
+        node = self.node_path.node()
+        if self.count == 0:
+            node.set_bounds(BoundingBox(Point3(0), Point3(0)))
+            node.set_final(True)
+            return
+        image = memoryview(self.texture.get_ram_image()).cast('B').cast('f')
+        data = image[:self.count * FLOATS_PER_INSTANCE]
+        try:
+            lo, hi, scale = _numpy_bounds(data, self.count)
+        except ImportError:
+            lo, hi, scale = _python_bounds(data)
+        r = self.radius * scale ** 0.5
+        node.set_bounds(BoundingBox(Point3(lo[0] - r, lo[1] - r, lo[2] - r),
+                                    Point3(hi[0] + r, hi[1] + r, hi[2] + r)))
+        node.set_final(True)
+
+    def _resize(self, capacity):
+        old = None
+        if self.capacity:
+            old = bytes(memoryview(self.texture.get_ram_image()))
+        self.texture.setup_buffer_texture(capacity * 4, Texture.T_float,
+                                          Texture.F_rgba32, GeomEnums.UH_dynamic)
+        if old:
+            memoryview(self.texture.modify_ram_image()).cast('B')[:len(old)] = old
+        self.capacity = capacity
+
+def _as_float_view(transforms):
+    """Returns a flat float memoryview of the transforms"""
+    try:
+        view = memoryview(transforms)
+    except TypeError:
+        return memoryview(pack_transforms(transforms))
+    if view.format != 'f':
+        raise TypeError('Instance transforms must be float32, got {0!r}'.format(view.format))
+    return view.cast('B').cast('f')
+
+def _python_bounds(data):
+    """Returns the min and max instance positions and the max squared scale"""
+    lo = [float('inf')] * 3
+    hi = [float('-inf')] * 3
+    scale = 0.0
+    for i in range(0, len(data), FLOATS_PER_INSTANCE):
+        for axis in range(3):
+            value = data[i + 12 + axis]
+            if value < lo[axis]:
+                lo[axis] = value
+            if value > hi[axis]:
+                hi[axis] = value
+        for row in range(0, 12, 4):
+            row_scale = data[i + row] ** 2 + data[i + row + 1] ** 2 + data[i + row + 2] ** 2
+            if row_scale > scale:
+                scale = row_scale
+    return lo, hi, scale
+
+def _numpy_bounds(data, count):
+    """Same as _python_bounds(), only faster, needs numpy"""
+    import numpy
+    matrices = numpy.frombuffer(data, dtype=numpy.float32, count=count * FLOATS_PER_INSTANCE)
+    matrices = matrices.reshape(count, 4, 4)
+    positions = matrices[:, 3, :3]
+    scale = float((matrices[:, :3, :3] ** 2).sum(axis=2).max())
+    return positions.min(axis=0).tolist(), positions.max(axis=0).tolist(), scale
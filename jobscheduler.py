@@ -0,0 +1,185 @@
+"""Time sliced jobs for PandaApp, for work too big for one frame.
+
+A job is a generator, it does a bit of work and yields at a point where
+it's safe to stop for a frame, eg:
+
+    def build_grid(self, size):
+        grid = []
+        for y in range(size):
+            grid.append([self.cost(x, y) for x in range(size)])
+            yield
+        return grid
+
+    job = self.add_job(self.build_grid(1024), 'grid', priority=1, callback=on_grid)
+
+Each frame the 'job_scheduler' task (started by PandaApp.restart(), after
+the intervals and before the frame is rendered) resumes the jobs, higher
+priority first and in the order they were added within a priority, for as
+long as 'job-budget' ms allows (one step always runs, so the jobs move on
+even on a slow frame). A job that yields often keeps the frame on budget,
+one that doesn't can't be stopped.
+What the generator returns is the job's result(), the callbacks are
+called when it's done, failed or cancelled.
+"""
+import heapq
+import itertools
+
+from direct.task import Task
+
+from framestats import clock
+from awaitable import Waiter
+
+__all__ = ['JobScheduler', 'Job']
+
+class Job(object):
+    """A job added with PandaApp.add_job(), can be awaited in a coroutine task"""
+    RUNNING, FINISHED, FAILED, CANCELLED = range(4)
+
+    def __init__(self, generator, name, priority=0, callback=None):
+        self.generator = generator
+        self.name = name
+        self.priority = priority
+        self.state = Job.RUNNING
+        self.steps = 0
+        self.time = 0.0
+        self.frames = 0
+        self.last_frame = -1
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        if callback is not None:
+            self._callbacks.append(callback)
+
+    def done(self):
+        return self.state != Job.RUNNING
+
+    def cancelled(self):
+        return self.state == Job.CANCELLED
+
+    def cancel(self):
+        """Stops the job (the generator gets closed), returns False if it's already done"""
+        if self.done():
+            return False
+        self.generator.close()
+        self._finish(Job.CANCELLED)
+        return True
+
+    def result(self):
+        """Returns what the generator returned (None if cancelled), re-raises if it failed"""
+        if not self.done():
+            raise RuntimeError('Job not finished')
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        return self._exception
+
+    def add_done_callback(self, callback):
+        """callback(job) is called once the job is done"""
+        if self.done():
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def get_stats(self):
+        """Returns the steps, frames and time (ms) the job used so far"""
+        return {'steps': self.steps,
+                'frames': self.frames,
+                'time_ms': self.time * 1000.0,
+                'mean_frame_ms': self.time * 1000.0 / self.frames if self.frames else 0.0,
+                'priority': self.priority,
+                'state': self.state}
+
+    def _step(self, frame):
+        """Runs the job to its next yield, returns False once it's done"""
+        if frame != self.last_frame:
+            self.last_frame = frame
+            self.frames += 1
+        start = clock()
+        try:
+            next(self.generator)
+        except StopIteration as e:
+            #py2 generators can't return a value
+            self._result = getattr(e, 'value', None)
+            self._finish(Job.FINISHED)
+        except Exception as e:
+            self._exception = e
+            self._finish(Job.FAILED)
+        finally:
+            self.time += clock() - start
+            self.steps += 1
+        return not self.done()
+
+    def _finish(self, state):
+        self.state = state
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def __await__(self):
+        return Waiter(self)
+
+class JobScheduler(object):
+    def __init__(self, budget=2.0, frame_stats=None, history=120):
+        self.budget = budget / 1000.0
+        self.frame_stats = frame_stats
+        self.history = max(1, history)
+        self.frame = 0
+        self.frame_times = []
+        self._queue = []
+        self._seq = itertools.count()
+
+    def add(self, generator, name=None, priority=0, callback=None):
+        """Adds a job, higher priority jobs get the frame time first. Returns a Job."""
+        if name is None:
+            name = getattr(generator, '__name__', 'job')
+        job = Job(generator, name, priority, callback)
+        heapq.heappush(self._queue, (-priority, next(self._seq), job))
+        return job
+
+    def get_jobs(self):
+        """Returns the jobs not done yet, in the order they get run"""
+        return [item[2] for item in sorted(self._queue) if not item[2].done()]
+
+    def cancel_all(self):
+        for item in self._queue:
+            item[2].cancel()
+        self._queue = []
+
+    def update(self, task=None):
+        """Runs the jobs until the budget for this frame is used up"""
+        self.frame += 1
+        if not self._queue:
+            return Task.cont
+        start = clock()
+        deadline = start + self.budget
+        queue = self._queue
+        steps = 0
+        while queue:
+            job = queue[0][2]
+            if job.done():
+                heapq.heappop(queue)
+                continue
+            #a finished job is popped on the next pass, the callbacks may have added jobs
+            job._step(self.frame)
+            steps += 1
+            if clock() >= deadline:
+                break
+        used = clock() - start
+        if len(self.frame_times) >= self.history:
+            del self.frame_times[0]
+        self.frame_times.append(used)
+        if self.frame_stats:
+            self.frame_stats.count('job_steps', steps)
+        return Task.cont
+
+    def get_stats(self):
+        """Returns the budget and time used per frame (ms) over the last
+        'history' frames that had jobs, and the stats of each job left"""
+        stats = {'budget_ms': self.budget * 1000.0,
+                 'jobs': [dict(job.get_stats(), name=job.name) for job in self.get_jobs()]}
+        if self.frame_times:
+            stats['mean_ms'] = sum(self.frame_times) * 1000.0 / len(self.frame_times)
+            stats['max_ms'] = max(self.frame_times) * 1000.0
+        return stats
@@ -0,0 +1,103 @@
+"""Startup asset prefetching for PandaApp.
+
+With 'prefetch-manifest assets.json' PandaApp writes down which models,
+textures and GLSL shaders get loaded (load_model(), load_tex(),
+load_glsl_shader() and their async versions) in the first
+'prefetch-record-time' seconds, in order, and saves that list to the
+manifest. On the next start everything in the manifest is loaded in the
+background on the async loader threads (in the same order, but below the
+priority of your own async loads), so the assets sit in the ModelPool,
+TexturePool, shader cache (or asset cache) by the time the code asks for
+them. The manifest is re-recorded on every run, so it follows the code.
+What the prefetch loaded is held on to until the code loads it itself
+(or the recording time is over), so the asset cache can't drop it first.
+
+Only plain loads get recorded, a load with extra keywords (loaderOptions,
+okMissing, etc) is left out.
+"""
+import json
+import threading
+
+from framestats import clock
+
+__all__ = ['AssetManifest']
+
+class AssetManifest(object):
+    VERSION = 1
+
+    def __init__(self, path, record_time=10.0):
+        self.path = path
+        self.record_time = record_time
+        self.recording = record_time > 0
+        self.start = clock()
+        self.assets = []
+        self.num_prefetched = 0
+        self._seen = set()
+        #json key: prefetched asset, kept until it's loaded for real
+        self._held = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def read(self):
+        """Returns the [kind, args] list saved in the manifest, [] if there is none"""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return []
+        if not isinstance(data, dict) or data.get('version') != AssetManifest.VERSION:
+            return []
+        return data.get('assets', [])
+
+    def record(self, kind, args):
+        """Adds a load to the manifest, if still recording (and not prefetching)"""
+        if not self.recording or getattr(self._local, 'prefetching', False):
+            return
+        if clock() - self.start > self.record_time:
+            self.save()
+            return
+        key = json.dumps([kind, args], sort_keys=True)
+        with self._lock:
+            #the real load has the asset now
+            self._held.pop(key, None)
+            if self.recording and key not in self._seen:
+                self._seen.add(key)
+                self.assets.append([kind, args])
+
+    def save(self, task=None):
+        """Writes the recorded loads to the manifest and stops recording"""
+        with self._lock:
+            if not self.recording:
+                return
+            self.recording = False
+            assets = list(self.assets)
+            self._held.clear()
+        with open(self.path, 'w') as f:
+            json.dump({'version': AssetManifest.VERSION, 'assets': assets}, f, indent=1)
+
+    def prefetch(self, load_async, loaders):
+        """Queues the loads of the saved manifest with load_async(func, args, kwargs),
+        loaders is a dict of kind: load function. Returns the LoadHandles."""
+        handles = []
+        for i, (kind, args) in enumerate(self.read()):
+            func = loaders.get(kind)
+            if func is None:
+                continue
+            #earlier loads first, but after anything else on the async loader
+            handles.append(load_async(self._make_prefetch(kind, func), args, {'priority': -1 - i}))
+        self.num_prefetched = len(handles)
+        return handles
+
+    def _make_prefetch(self, kind, func):
+        local = self._local
+        def prefetch(*args):
+            local.prefetching = True
+            try:
+                asset = func(*args)
+            finally:
+                local.prefetching = False
+            key = json.dumps([kind, list(args)], sort_keys=True)
+            with self._lock:
+                if self.recording:
+                    self._held[key] = asset
+        return prefetch
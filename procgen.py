@@ -0,0 +1,173 @@
+"""Procedural geometry made in other processes, for PandaApp.generate_geom().
+
+Python code that makes meshes (terrain chunks, rocks, buildings...) holds
+the GIL, so running it on a task or a thread still stalls the frame.
+generate_geom() runs it on a process pool instead ('procgen-processes'
+of them, 0 means one per core). The function gets the args and returns
+(vertices, indices): vertices is anything with the buffer protocol holding
+float32 rows in the layout of the vertex format ('v3', 'v3n3', 'v3t2' or
+'v3n3t2', eg. x, y, z, nx, ny, nz for 'v3n3'), indices is uint32 triangle
+indices into them. The worker puts both into one block of shared memory
+(only its name goes back through the pipe, the data is never pickled),
+the 'procgen' task then copies them straight into a GeomVertexData and a
+GeomTriangles on the main thread, at most 'procgen-attach-per-frame' of
+them per frame, and attaches the new GeomNode to the parent, if given.
+
+The workers are started with the 'spawn' method on every platform (a
+forked worker would get copies of the locks held by the loader, capture
+and task chain threads), so the function has to be importable by them
+(a module level function, not a lambda or a method) and the main script
+needs the usual if __name__ == '__main__' guard.
+"""
+import itertools
+import os
+from array import array
+from collections import deque
+
+from direct.task import Task
+from panda3d.core import (GeomVertexFormat, GeomVertexData, GeomTriangles, Geom,
+                          GeomNode, GeomEnums, NodePath)
+
+from asyncloader import LoadHandle
+
+__all__ = ['ProcGen', 'make_geom_node', 'VERTEX_FORMATS']
+
+#name: (floats per vertex, GeomVertexFormat getter)
+VERTEX_FORMATS = {'v3': (3, GeomVertexFormat.get_v3),
+                  'v3n3': (6, GeomVertexFormat.get_v3n3),
+                  'v3t2': (5, GeomVertexFormat.get_v3t2),
+                  'v3n3t2': (8, GeomVertexFormat.get_v3n3t2)}
+
+def _as_bytes_view(data, typecode):
+    """Returns a flat byte memoryview of data, checking the item type"""
+    if not isinstance(data, (memoryview, array, bytes, bytearray)) and hasattr(data, 'tobytes'):
+        #eg. a numpy array that's not contiguous
+        view = memoryview(data)
+        if not view.c_contiguous:
+            data = data.tobytes()
+    view = memoryview(data)
+    if view.format not in (typecode, 'B'):
+        raise TypeError('Expected {0!r} data, got {1!r}'.format(typecode, view.format))
+    return view.cast('B')
+
+def _run_in_worker(func, args):
+    """Runs in the worker process, returns (shared memory name, vertex bytes, index bytes)"""
+    from multiprocessing import shared_memory
+    vertices, indices = func(*args)
+    vertices = _as_bytes_view(vertices, 'f')
+    indices = _as_bytes_view(indices, 'I')
+    vertex_size = len(vertices)
+    index_size = len(indices)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, vertex_size + index_size))
+    try:
+        shm.buf[:vertex_size] = vertices
+        shm.buf[vertex_size:vertex_size + index_size] = indices
+    finally:
+        vertices.release()
+        indices.release()
+        shm.close()
+    return shm.name, vertex_size, index_size
+
+def make_geom_node(name, vertex_format, vertices, indices):
+    """Makes a GeomNode out of float32 vertex data and uint32 triangle
+    indices (both as byte buffers), copying them once, straight into Panda"""
+    floats, get_format = VERTEX_FORMATS[vertex_format]
+    vdata = GeomVertexData(name, get_format(), Geom.UH_static)
+    vdata.unclean_set_num_rows(len(vertices) // (floats * 4))
+    memoryview(vdata.modify_array(0)).cast('B')[:] = vertices
+    prim = GeomTriangles(Geom.UH_static)
+    prim.set_index_type(GeomEnums.NT_uint32)
+    index_array = prim.modify_vertices()
+    index_array.unclean_set_num_rows(len(indices) // 4)
+    memoryview(index_array).cast('B')[:] = indices
+    geom = Geom(vdata)
+    geom.add_primitive(prim)
+    node = GeomNode(name)
+    node.add_geom(geom)
+    return NodePath(node)
+
+class ProcGen(object):
+    def __init__(self, num_processes=0, attach_per_frame=0):
+        self.num_processes = num_processes or os.cpu_count() or 1
+        self.attach_per_frame = attach_per_frame
+        self.pool = None
+        self.num_pending = 0
+        self._names = itertools.count()
+        #appended on the executor's thread, popped on the main thread
+        self._done = deque()
+
+    def submit(self, func, args, parent=None, callback=None, vertex_format='v3n3', name=None):
+        """Runs func(*args) on the pool, returns a LoadHandle for the NodePath"""
+        if vertex_format not in VERTEX_FORMATS:
+            raise ValueError('Unknown vertex format {0!r}'.format(vertex_format))
+        if self.pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            from multiprocessing import resource_tracker
+            #the workers have to share our resource tracker, else theirs would
+            #'clean up' the shared memory blocks they hand over to us
+            resource_tracker.ensure_running()
+            self.pool = ProcessPoolExecutor(self.num_processes,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        if name is None:
+            name = '{0}_{1}'.format(getattr(func, '__name__', 'generated'), next(self._names))
+        handle = LoadHandle(func, args, {}, parent, 0, callback)
+        handle.state = LoadHandle.LOADING
+        future = self.pool.submit(_run_in_worker, func, args)
+        self.num_pending += 1
+        future.add_done_callback(lambda future: self._done.append((handle, future, vertex_format, name)))
+        return handle
+
+    def update(self, task=None):
+        """Turns the finished results into GeomNodes, runs every frame on the main thread"""
+        if not self._done:
+            return Task.cont
+        from multiprocessing import shared_memory
+        made = 0
+        while self._done:
+            if self.attach_per_frame and made >= self.attach_per_frame:
+                break
+            handle, future, vertex_format, name = self._done.popleft()
+            self.num_pending -= 1
+            try:
+                shm_name, vertex_size, index_size = future.result()
+            except Exception as e:
+                handle._exception = e
+                handle._finish()
+                continue
+            shm = shared_memory.SharedMemory(name=shm_name)
+            vertices = shm.buf[:vertex_size]
+            indices = shm.buf[vertex_size:vertex_size + index_size]
+            try:
+                if not handle.cancelled():
+                    handle._result = make_geom_node(name, vertex_format, vertices, indices)
+                    made += 1
+            except Exception as e:
+                handle._exception = e
+            finally:
+                #the views have to go before the shared memory can be closed
+                vertices.release()
+                indices.release()
+                shm.close()
+                shm.unlink()
+            handle._finish()
+        return Task.cont
+
+    def shutdown(self):
+        """Stops the workers, the jobs not started yet are cancelled, this
+        waits for the ones running, and all the handles not done get cancelled"""
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
+        if not self._done:
+            return
+        from multiprocessing import shared_memory
+        #every future is done now, and has put itself in _done
+        while self._done:
+            handle, future, vertex_format, name = self._done.popleft()
+            self.num_pending -= 1
+            handle.cancel()
+            if not future.cancelled() and future.exception() is None:
+                shm = shared_memory.SharedMemory(name=future.result()[0])
+                shm.close()
+                shm.unlink()
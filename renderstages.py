@@ -0,0 +1,67 @@
+"""Timing of the render pipeline stages for PandaApp.
+
+With 'render-stage-timing 1' the display regions of the main window get
+cull and draw callbacks that time the default cull/draw (so with a
+threaded 'render-threading-model' the times come from the cull and draw
+threads), PandaApp also adds the time the app thread spends in
+render_frame(). Note that calling into Python from the cull and draw
+threads needs the GIL, so leave it off when not measuring.
+"""
+from __future__ import division
+from collections import deque
+
+from panda3d.core import PythonCallbackObject, Thread
+
+from framestats import clock
+
+__all__ = ['RenderStageTimer']
+
+class RenderStageTimer(object):
+    def __init__(self, history=120):
+        self.history = history
+        self.times = {}
+        self.threads = {}
+
+    def reset(self):
+        """Forgets all recorded times"""
+        self.times = {}
+
+    def add(self, stage, seconds):
+        """Records the time of one stage, can be called from any thread"""
+        times = self.times.get(stage)
+        if times is None:
+            times = self.times.setdefault(stage, deque(maxlen=self.history))
+        times.append(seconds)
+
+    def attach(self, display_region):
+        """Times the cull and draw of the display region"""
+        name = display_region.get_camera().get_name() if display_region.get_camera() else 'dr'
+        display_region.set_cull_callback(PythonCallbackObject(self._make_callback('cull', name)))
+        display_region.set_draw_callback(PythonCallbackObject(self._make_callback('draw', name)))
+
+    def detach(self, display_region):
+        display_region.clear_cull_callback()
+        display_region.clear_draw_callback()
+
+    def _make_callback(self, stage, name):
+        add = self.add
+        threads = self.threads
+        key = '{0}_{1}'.format(stage, name)
+        def callback(cbdata):
+            start = clock()
+            cbdata.upcall()
+            add(key, clock() - start)
+            if key not in threads:
+                threads[key] = Thread.get_current_thread().get_name()
+        return callback
+
+    def get_stats(self):
+        """Returns {stage: {'mean_ms', 'max_ms', 'thread'}} over the last 'history' frames"""
+        stats = {}
+        for stage, times in list(self.times.items()):
+            times = list(times)
+            if times:
+                stats[stage] = {'mean_ms': sum(times) * 1000.0 / len(times),
+                                'max_ms': max(times) * 1000.0,
+                                'thread': self.threads.get(stage, 'app')}
+        return stats
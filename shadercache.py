@@ -0,0 +1,160 @@
+"""GLSL shader variant cache used by PandaApp.load_glsl_shader().
+
+Shader sources are read once and shared by all the variants made from
+them, a variant is keyed by the content hashes of its sources, the set
+of defines and the version line. A source that changed on disk gets
+re-read (and so makes new variants) on the next lookup.
+With a cache_dir the preprocessed source of each variant is also kept on
+disk (named after the hash of its key) and reused from there.
+It's safe to use from more than one thread (the prefetch does that).
+"""
+import hashlib
+import os
+import threading
+from collections import namedtuple, OrderedDict
+
+from panda3d.core import Shader, getModelPath
+
+__all__ = ['ShaderCache', 'make_define_key']
+
+ShaderCacheInfo = namedtuple('ShaderCacheInfo', ['hits', 'misses', 'evictions', 'disk_hits',
+                                                 'source_reads', 'maxsize', 'currsize'])
+
+def make_define_key(define):
+    """Returns a hashable, order independent version of a define dict
+    (or of an iterable of (name, value) pairs)"""
+    if not define:
+        return ()
+    if hasattr(define, 'items'):
+        define = define.items()
+    return tuple(sorted((str(name), str(value)) for name, value in define))
+
+class _ShaderSource(object):
+    """Text of a shader file, with its hash and the mtime/size it was read at"""
+    def __init__(self, path):
+        self.path = path
+        stat = os.stat(path)
+        self.mtime = stat.st_mtime
+        self.size = stat.st_size
+        with open(path) as f:
+            self.text = f.read()
+        self.digest = hashlib.sha1(self.text.encode('utf-8')).hexdigest()
+        self._parts = {}
+
+    def is_stale(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return stat.st_mtime != self.mtime or stat.st_size != self.size
+
+    def with_header(self, version, header):
+        """Returns the text with every version line replaced by the header"""
+        parts = self._parts.get(version)
+        if parts is None:
+            parts = self._parts[version] = self.text.split(version)
+        return header.join(parts)
+
+class ShaderCache(object):
+    """LRU cache of GLSL shader variants, see the module docstring"""
+    def __init__(self, maxsize=256, cache_dir='', check_files=True):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.check_files = check_files
+        self._paths = {}
+        self._sources = {}
+        self._variants = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self.source_reads = 0
+        self._lock = threading.RLock()
+
+    def get(self, v_shader, f_shader, define=None, version='#version 140'):
+        """Returns the shader made from the v_shader and f_shader files,
+        with define (a dict of name:value) added after the version line"""
+        with self._lock:
+            return self._get(v_shader, f_shader, define, version)
+
+    def _get(self, v_shader, f_shader, define, version):
+        v_source = self._get_source(v_shader)
+        f_source = self._get_source(f_shader)
+        define_key = make_define_key(define)
+        key = (v_source.digest, f_source.digest, define_key, version)
+        shader = self._variants.get(key)
+        if shader is not None:
+            #pop and put back, OrderedDict has no move_to_end() on py2
+            self._variants[key] = self._variants.pop(key)
+            self.hits += 1
+            return shader
+        self.misses += 1
+        shader = self._make_shader(key, v_shader, f_shader, v_source, f_source, define_key, version)
+        self._variants[key] = shader
+        if self.maxsize and len(self._variants) > self.maxsize:
+            self._variants.popitem(last=False)
+            self.evictions += 1
+        return shader
+
+    def cache_info(self):
+        with self._lock:
+            return ShaderCacheInfo(self.hits, self.misses, self.evictions, self.disk_hits,
+                                   self.source_reads, self.maxsize, len(self._variants))
+
+    def cache_clear(self):
+        """Forgets all sources and variants (the disk cache is left alone)"""
+        with self._lock:
+            self._paths.clear()
+            self._sources.clear()
+            self._variants.clear()
+
+    def _get_source(self, name):
+        path = self._paths.get(name)
+        if path is None:
+            path = getModelPath().find_file(name).to_os_specific()
+            if path:
+                self._paths[name] = path
+        source = self._sources.get(path)
+        if source is None or (self.check_files and source.is_stale()):
+            source = self._sources[path] = _ShaderSource(path)
+            self.source_reads += 1
+        return source
+
+    def _make_shader(self, key, v_shader, f_shader, v_source, f_source, define_key, version):
+        v_shader_txt = f_shader_txt = None
+        if self.cache_dir:
+            digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+            v_cached = os.path.join(self.cache_dir, digest + '.vert.glsl')
+            f_cached = os.path.join(self.cache_dir, digest + '.frag.glsl')
+            if os.path.exists(v_cached) and os.path.exists(f_cached):
+                with open(v_cached) as f:
+                    v_shader_txt = f.read()
+                with open(f_cached) as f:
+                    f_shader_txt = f.read()
+                self.disk_hits += 1
+        if v_shader_txt is None:
+            # make the header and put it on top
+            if define_key:
+                header = version + '\n'
+                for name, value in define_key:
+                    header += '#define {0} {1}\n'.format(name, value)
+                v_shader_txt = v_source.with_header(version, header)
+                f_shader_txt = f_source.with_header(version, header)
+            else:
+                v_shader_txt = v_source.text
+                f_shader_txt = f_source.text
+            if self.cache_dir:
+                if not os.path.isdir(self.cache_dir):
+                    os.makedirs(self.cache_dir)
+                with open(v_cached, 'w') as f:
+                    f.write(v_shader_txt)
+                with open(f_cached, 'w') as f:
+                    f.write(f_shader_txt)
+        # make the shader
+        shader = Shader.make(Shader.SL_GLSL, v_shader_txt, f_shader_txt)
+        try:
+            shader.set_filename(Shader.ST_vertex, v_shader)
+            shader.set_filename(Shader.ST_fragment, f_shader)
+        except:
+            print('Shader filenames will not be available, consider using a dev version of Panda3D')
+        return shader
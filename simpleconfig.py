@@ -1,16 +1,44 @@
-from six import with_metaclass
 from panda3d.core import *
 load_prc_file_data("", "notify-level-prc error")
 
 class MetaConfig(type):
     """Metaclass for the config class, actually implements all the logic.
     This is used to make __getitem__ and __setitem__ static class methods
+
+    Resolved values are cached by name, the cache is dropped for a key
+    when it's set with __setitem__ and for all keys when a prc page is
+    loaded or unloaded. Variables that are not declared yet are not cached,
+    their value (and type) changes once they are, and Panda declares some
+    of them lazily (eg. model-path in getModelPath()).
+    Loading through cls.load_prc_file()/load_prc_file_data() takes effect
+    at once, pages loaded any other way are noticed on the next cls.sync()
+    (PandaApp calls it once per frame).
     """
     def __getitem__(cls, key):
-        value_type=ConfigVariable(key).get_value_type()
+        try:
+            value = cls._cache[key]
+        except KeyError:
+            defined, value = cls._lookup(key)
+            if defined:
+                cls._cache[key] = value
+        if type(value) is list:
+            return list(value)
+        return value
+
+    def _resolve(cls, key):
+        """Reads the value of a config variable, without the cache"""
+        return cls._lookup(key)[1]
+
+    def _lookup(cls, key):
+        """Returns (is the variable declared, its value)"""
+        var=ConfigVariable(key)
+        value_type=var.get_value_type()
         if value_type == ConfigVariable.VT_undefined:
-            return ConfigVariable(key).get_string_value()
-        elif value_type == ConfigVariable.VT_list:
+            return False, var.get_string_value()
+        return True, cls._typed_value(key, var, value_type)
+
+    def _typed_value(cls, key, var, value_type):
+        if value_type == ConfigVariable.VT_list:
             return  [i for i in ConfigVariableList(key)]
         elif value_type == ConfigVariable.VT_string:
             return ConfigVariableString(key).get_value()
@@ -19,24 +47,56 @@ class MetaConfig(type):
         elif value_type == ConfigVariable.VT_bool:
             return ConfigVariableBool(key).get_value()
         elif value_type == ConfigVariable.VT_int:
-            num_words=ConfigVariableInt(key).get_num_words()
+            var=ConfigVariableInt(key)
+            num_words=var.get_num_words()
             if num_words >1:
-                return [ConfigVariableInt(key).get_word(i) for i in range(num_words)]
+                return [var.get_word(i) for i in range(num_words)]
             else:
-                return ConfigVariableInt(key).get_value()
+                return var.get_value()
         elif value_type == ConfigVariable.VT_double:
             return ConfigVariableDouble(key).get_value()
         elif value_type == ConfigVariable.VT_enum:
-            return ConfigVariable(key).get_string_value()
+            return var.get_string_value()
         elif value_type == ConfigVariable.VT_search_path:
             return ConfigVariableSearchPath(key).get_value()
         elif value_type == ConfigVariable.VT_int64:
             return ConfigVariableInt64(key).get_value()
         elif value_type == ConfigVariable.VT_color:
             return ConfigVariableColor(key).get_value()
-        return ConfigVariable(key).get_string_value()
+        return var.get_string_value()
+
+    def snapshot(cls, keys):
+        """Returns a dict with the values of all the keys"""
+        return {key: cls[key] for key in keys}
+
+    def invalidate(cls, key=None):
+        """Drops the cached value of key, or all cached values if key is None"""
+        if key is None:
+            cls._cache.clear()
+        else:
+            cls._cache.pop(key, None)
+
+    def sync(cls):
+        """Drops the cache if prc pages were loaded or unloaded since the last call"""
+        pages = _get_page_state()
+        if pages != cls._pages:
+            cls._pages = pages
+            cls._cache.clear()
+
+    def load_prc_file(cls, filename):
+        """Same as panda3d.core.load_prc_file(), but updates the cache at once"""
+        page = load_prc_file(filename)
+        cls.sync()
+        return page
+
+    def load_prc_file_data(cls, name, data):
+        """Same as panda3d.core.load_prc_file_data(), but updates the cache at once"""
+        page = load_prc_file_data(name, data)
+        cls.sync()
+        return page
 
     def __setitem__(cls, key, value):
+        cls._cache.pop(key, None)
         value_type=ConfigVariable(key).get_value_type()
         if value_type == ConfigVariable.VT_undefined:
             ConfigVariable(key).set_string_value(value)
@@ -64,8 +124,17 @@ class MetaConfig(type):
     def __contains__(cls, item):
         return ConfigVariable(item).hasValue()
 
-class SimpleConfig(with_metaclass(MetaConfig, object)):
-    """This class is a wrapper for Panda3D ConfigVariable*
+def _get_page_state():
+    """Something that changes when a prc page is loaded or unloaded"""
+    mgr = ConfigPageManager.get_global_ptr()
+    num_explicit = mgr.get_num_explicit_pages()
+    last_seq = mgr.get_explicit_page(num_explicit - 1).get_page_seq() if num_explicit else 0
+    return mgr.get_num_implicit_pages(), num_explicit, last_seq
+
+#Made by calling the metaclass, so it works on py2 and py3 without six
+SimpleConfig = MetaConfig('SimpleConfig', (object,), {
+    '__doc__': """This class is a wrapper for Panda3D ConfigVariable*
     with dict like interface (SimpleConfig['some_config_name']=some_value)
-    """
-    pass
+    """,
+    '_cache': {},
+    '_pages': _get_page_state()})
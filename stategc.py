@@ -0,0 +1,99 @@
+"""Adaptive garbage collection of Panda's RenderState/TransformState caches.
+
+With 'garbage-collect-states' on, Panda keeps unused states in its caches
+until garbage_collect() is called. Calling it every frame costs time even
+when there's nothing to collect, and a frame that does have a lot to
+collect spikes. StateGC looks at the size of the caches instead and only
+starts collecting once they grew by 'state-gc-threshold' states since the
+last sweep. A sweep is done in slices, each garbage_collect() call walks
+'state-gc-slice' of the cache (Panda's 'garbage-collect-states-rate', set
+only for our own calls and put back after), and slices are run only while
+they fit in 'state-gc-budget' ms per frame, so a big sweep is spread over
+a few frames. The cache shrinks as it's collected and freeing a state can
+make others garbage, so a sweep ends only once the slices walked the
+whole cache without finding anything more to collect.
+"""
+from __future__ import division
+
+from panda3d.core import TransformState, RenderState, ConfigVariableDouble
+
+from framestats import clock
+
+__all__ = ['StateGC']
+
+class StateGC(object):
+    def __init__(self, threshold=1000, budget=0.5, slice_rate=0.25, frame_stats=None):
+        self.threshold = threshold
+        self.budget = budget / 1000.0
+        self.frame_stats = frame_stats
+        self.set_slice_rate(slice_rate)
+        self.collecting = False
+        self.baseline = self.get_num_states()
+        #states walked since a slice last collected something
+        self.walked = 0.0
+        self.collected = 0
+        self.sweeps = 0
+        self.time = 0.0
+        self.last_collected = 0
+        self.last_time = 0.0
+
+    def set_slice_rate(self, rate):
+        """Sets the part (0.0-1.0) of the caches each garbage_collect() walks"""
+        self.slice_rate = min(1.0, max(0.01, rate))
+
+    def get_num_states(self):
+        return TransformState.get_num_states() + RenderState.get_num_states()
+
+    def update(self):
+        """Collects if needed, within the budget, call once per frame"""
+        self.last_collected = 0
+        self.last_time = 0.0
+        if not self.collecting:
+            if self.get_num_states() - self.baseline < self.threshold:
+                return 0
+            self.collecting = True
+            self.walked = 0.0
+        start = clock()
+        deadline = start + self.budget
+        collected = 0
+        rate = ConfigVariableDouble('garbage-collect-states-rate')
+        had_local_rate = rate.has_local_value()
+        old_rate = rate.get_value()
+        rate.set_value(self.slice_rate)
+        try:
+            #always at least one slice, so a sweep can't stall on a tiny budget
+            while True:
+                num_states = self.get_num_states()
+                found = TransformState.garbage_collect() + RenderState.garbage_collect()
+                collected += found
+                if found:
+                    self.walked = 0.0
+                else:
+                    self.walked += max(1.0, num_states * self.slice_rate)
+                    if self.walked >= self.get_num_states():
+                        self.collecting = False
+                        self.sweeps += 1
+                        self.baseline = self.get_num_states()
+                        break
+                if clock() >= deadline:
+                    break
+        finally:
+            if had_local_rate:
+                rate.set_value(old_rate)
+            else:
+                rate.clear_local_value()
+        self.last_time = clock() - start
+        self.last_collected = collected
+        self.time += self.last_time
+        self.collected += collected
+        if self.frame_stats:
+            self.frame_stats.count('states_collected', collected)
+            self.frame_stats.add('state_gc', self.last_time)
+        return collected
+
+    def get_stats(self):
+        return {'states': self.get_num_states(),
+                'collected': self.collected,
+                'sweeps': self.sweeps,
+                'time_ms': self.time * 1000.0,
+                'collecting': self.collecting}
@@ -0,0 +1,128 @@
+"""Index of the tasks owned by a PandaApp.
+
+Tasks are indexed by id, by name and by an optional user group, so
+removing by name is a dict lookup and whole groups can be paused,
+resumed or removed at once. A paused task is taken out of the task
+manager (so it costs nothing per frame, but note that uponDeath gets
+called) and put back as it was on resume, a doMethodLater task starts
+its delay again.
+
+Tasks added to a group are timed (number of calls and total seconds),
+see get_group_stats().
+"""
+from functools import wraps
+
+from framestats import clock
+
+__all__ = ['TaskRegistry']
+
+class TaskRegistry(object):
+    def __init__(self, task_mgr):
+        self.task_mgr = task_mgr
+        #task.id: task, this is also the DirectObject style _taskList
+        self.tasks = {}
+        self.names = {}
+        self.groups = {}
+        self.task_groups = {}
+        self.paused = {}
+        self.group_stats = {}
+
+    def add(self, task):
+        """Called when an owned task is added to the task manager"""
+        self.tasks[task.id] = task
+        self.names.setdefault(task.name, {})[task.id] = task
+        group = self.task_groups.get(task.id)
+        if group is not None:
+            self.groups.setdefault(group, {})[task.id] = task
+
+    def clear(self, task):
+        """Called when an owned task is removed from the task manager"""
+        self.tasks.pop(task.id, None)
+        for index, key in ((self.names, task.name), (self.groups, self.task_groups.get(task.id))):
+            tasks = index.get(key)
+            if tasks is not None:
+                tasks.pop(task.id, None)
+                if not tasks:
+                    del index[key]
+        group = self.task_groups.get(task.id)
+        if group is None or task.id not in self.paused.get(group, {}):
+            self.task_groups.pop(task.id, None)
+
+    def set_group(self, task, group):
+        """Puts an (already added) task into a group"""
+        self.task_groups[task.id] = group
+        if task.id in self.tasks:
+            self.groups.setdefault(group, {})[task.id] = task
+
+    def wrap(self, func, group):
+        """Returns func wrapped to count calls and time for the group"""
+        stats = self.group_stats.setdefault(group, [0, 0.0])
+        @wraps(func)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats[0] += 1
+                stats[1] += clock() - start
+        return timed
+
+    def get_tasks(self, name):
+        """Returns a list of the tasks with the given name"""
+        return list(self.names.get(name, {}).values())
+
+    def get_group(self, group):
+        """Returns a list of the running tasks in the group"""
+        return list(self.groups.get(group, {}).values())
+
+    def get_group_stats(self, group):
+        """Returns {'calls': n, 'seconds': total, 'paused': number of paused tasks}"""
+        calls, seconds = self.group_stats.get(group, (0, 0.0))
+        return {'calls': calls, 'seconds': seconds, 'paused': len(self.paused.get(group, ()))}
+
+    def remove(self, name):
+        """Removes all the tasks with the given name, running or paused"""
+        for group, paused in list(self.paused.items()):
+            for task in [task for task in paused.values() if task.name == name]:
+                self._forget_paused(group, task)
+        for task in self.get_tasks(name):
+            task.remove()
+
+    def remove_task(self, task):
+        """Removes one task, running or paused"""
+        group = self.task_groups.get(task.id)
+        if task.id in self.paused.get(group, {}):
+            self._forget_paused(group, task)
+        task.remove()
+
+    def _forget_paused(self, group, task):
+        """Drops a paused task, so resuming the group doesn't bring it back"""
+        paused = self.paused[group]
+        del paused[task.id]
+        if not paused:
+            del self.paused[group]
+        self.task_groups.pop(task.id, None)
+
+    def pause_group(self, group):
+        paused = self.paused.setdefault(group, {})
+        for task in self.get_group(group):
+            paused[task.id] = task
+            task.remove()
+
+    def resume_group(self, group):
+        for task in self.paused.pop(group, {}).values():
+            #mgr.add() and not task_mgr.add(), so the task keeps its args
+            self.task_mgr.mgr.add(task)
+
+    def remove_group(self, group):
+        for task in self.paused.pop(group, {}).values():
+            self.task_groups.pop(task.id, None)
+        for task in self.get_group(group):
+            task.remove()
+        self.group_stats.pop(group, None)
+
+    def remove_all(self):
+        for group in list(self.paused):
+            self.remove_group(group)
+        for task in list(self.tasks.values()):
+            task.remove()
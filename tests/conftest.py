@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from panda3d.core import load_prc_file_data
+load_prc_file_data('tests', 'window-type none\n'
+                            'audio-library-name null\n'
+                            'frame-stats-file \n')
+
+@pytest.fixture(scope='session')
+def app():
+    """One headless PandaApp for all the tests"""
+    from PandaApp import PandaApp
+    app = PandaApp()
+    yield app
+    app.destroy()
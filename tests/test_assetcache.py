@@ -0,0 +1,12 @@
+from assetcache import AssetCache
+
+def test_model_names_share_an_entry(app):
+    cache = AssetCache(app.loader, 64 * 1024 * 1024)
+    with_extension = cache.load_model('frowney.egg')
+    without_extension = cache.load_model('frowney')
+    assert with_extension is not None and without_extension is not None
+    stats = cache.get_stats()
+    assert stats['assets'] == 1
+    assert stats['misses'] == 1
+    assert stats['hits'] == 1
+    cache.clear()
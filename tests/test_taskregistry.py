@@ -0,0 +1,33 @@
+def test_remove_paused_task_by_name(app):
+    calls = []
+
+    def work(task):
+        calls.append(task.name)
+        return task.cont
+    app.add_task(work, 'paused_work', group='paused_group')
+    app.add_task(work, 'other_work', group='paused_group')
+    app.task_mgr.step()
+    app.pause_task_group('paused_group')
+    assert app.get_task_group_stats('paused_group')['paused'] == 2
+
+    app.remove_task('paused_work')
+    assert app.get_task_group_stats('paused_group')['paused'] == 1
+    app.resume_task_group('paused_group')
+    del calls[:]
+    app.task_mgr.step()
+    assert calls == ['other_work']
+    assert not app.task_mgr.getTasksNamed('paused_work')
+
+    app.remove_task_group('paused_group')
+
+def test_remove_paused_task(app):
+    def work(task):
+        return task.cont
+    task = app.add_task(work, 'paused_task', group='paused_group')
+    app.pause_task_group('paused_group')
+
+    app.remove_task(task)
+    assert app.get_task_group_stats('paused_group')['paused'] == 0
+    app.resume_task_group('paused_group')
+    assert not app.task_mgr.getTasksNamed('paused_task')
+    assert task.id not in app.task_registry.task_groups
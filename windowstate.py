@@ -0,0 +1,61 @@
+"""Window state tracking for PandaApp.
+
+PandaApp takes at most one snapshot of the main window properties per
+frame (and only if Panda said something changed), WindowState diffs it
+with the previous snapshot and returns the events for the transitions,
+each one just once and with the new values as arguments:
+window-event-resize [x_size, y_size]
+window-event-close
+window-event-focus / window-event-focus-lost
+window-event-minimize / window-event-restore
+A resize is only reported once the size didn't change for resize_delay
+seconds, so dragging the window border makes just one trailing event.
+"""
+
+__all__ = ['WindowState']
+
+class WindowState(object):
+    def __init__(self, size=(0, 0), foreground=False, minimized=False, resize_delay=0.1):
+        self.size = tuple(size)
+        self.open = True
+        self.foreground = foreground
+        self.minimized = minimized
+        self.resize_delay = resize_delay
+        self.reported_size = self.size
+        self.resize_time = None
+
+    def is_resize_pending(self):
+        return self.resize_time is not None
+
+    def update(self, props, now):
+        """Takes the current WindowProperties (or None if there's no new
+        snapshot this frame) and the current time, returns a list of
+        (event, args) for what changed since the last call"""
+        events = []
+        if props is not None:
+            size = (props.get_x_size(), props.get_y_size())
+            if size != self.size:
+                self.size = size
+                self.resize_time = now
+            if props.get_open() != self.open:
+                self.open = props.get_open()
+                if not self.open:
+                    events.append(('window-event-close', []))
+            if props.get_foreground() != self.foreground:
+                self.foreground = props.get_foreground()
+                if self.foreground:
+                    events.append(('window-event-focus', []))
+                else:
+                    events.append(('window-event-focus-lost', []))
+            if props.get_minimized() != self.minimized:
+                self.minimized = props.get_minimized()
+                if self.minimized:
+                    events.append(('window-event-minimize', []))
+                else:
+                    events.append(('window-event-restore', []))
+        if self.resize_time is not None and now - self.resize_time >= self.resize_delay:
+            self.resize_time = None
+            if self.size != self.reported_size:
+                self.reported_size = self.size
+                events.insert(0, ('window-event-resize', list(self.size)))
+        return events